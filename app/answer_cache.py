@@ -0,0 +1,102 @@
+import re
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Default cache config
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL_SECONDS = 6 * 60 * 60
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+
+
+def normalize_question(question):
+    # Case, whitespace and trailing punctuation do not change what is being asked
+    question = re.sub(r"\s+", " ", question.lower()).strip()
+    return question.rstrip("?!. ")
+
+
+class _Entry:
+    def __init__(self, answer, vector):
+        self.answer = answer
+        self.vector = vector
+        self.created_at = time.monotonic()
+
+
+# Per-framework cache of LLM answers in front of the generation step. Questions are looked up
+# by their normalized text first, then by cosine similarity of the query embedding. Entries
+# expire after `ttl_seconds`, the least recently used ones are evicted beyond `max_entries`
+# per framework, and a framework's entries are dropped when its index generation changes.
+class AnswerCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.entries = {}
+        self.generations = {}
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _framework_entries(self, framework, generation):
+        # Reindexing a framework invalidates every answer built from its old context
+        if self.generations.get(framework) != generation:
+            self.entries.pop(framework, None)
+            self.generations[framework] = generation
+        return self.entries.setdefault(framework, OrderedDict())
+
+    def _expired(self, entry):
+        return time.monotonic() - entry.created_at > self.ttl_seconds
+
+    def lookup(self, framework, question, query_vector, generation):
+        entries = self._framework_entries(framework, generation)
+        key = normalize_question(question)
+
+        entry = entries.get(key)
+        if entry is not None and not self._expired(entry):
+            entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry.answer
+
+        # Drop expired entries before comparing embeddings
+        for expired_key in [k for k, e in entries.items() if self._expired(e)]:
+            del entries[expired_key]
+
+        if entries and query_vector is not None:
+            keys = list(entries)
+            vectors = np.stack([entries[k].vector for k in keys])
+            query = np.asarray(query_vector, dtype=np.float32)
+            similarities = vectors @ query / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query) + 1e-12)
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.similarity_threshold:
+                entries.move_to_end(keys[best])
+                self.semantic_hits += 1
+                return entries[keys[best]].answer
+
+        self.misses += 1
+        return None
+
+    def store(self, framework, question, query_vector, answer, generation):
+        entries = self._framework_entries(framework, generation)
+        key = normalize_question(question)
+        entries[key] = _Entry(answer, np.asarray(query_vector, dtype=np.float32))
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def invalidate(self, framework):
+        self.entries.pop(framework, None)
+
+    def stats(self):
+        hits = self.exact_hits + self.semantic_hits
+        total = hits + self.misses
+        return {
+            "hits": hits,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "entries": {framework: len(entries) for framework, entries in self.entries.items()},
+        }
@@ -0,0 +1,193 @@
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+
+# BM25 parameters
+DEFAULT_K1 = 1.2
+DEFAULT_B = 0.75
+
+# Rank constant of reciprocal rank fusion
+DEFAULT_RRF_K = 60
+
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+_CAMEL_PARTS = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def bm25_index_path(db_path, collection_name):
+    return os.path.join(db_path, "bm25", f"{collection_name}.npz")
+
+
+# Identifiers are kept whole (`select_related`, `statefulwidget`) and also split into their
+# snake_case and camelCase parts, so both the exact name and its words can match
+@lru_cache(maxsize=1 << 16)
+def _identifier_tokens(identifier):
+    parts = [part.lower() for piece in identifier.split("_") for part in _CAMEL_PARTS.findall(piece)]
+    if len(parts) > 1:
+        return (identifier.lower(), *parts)
+    return (identifier.lower(),)
+
+
+def tokenize(text):
+    tokens = []
+    for identifier in _IDENTIFIER.findall(text):
+        tokens.extend(_identifier_tokens(identifier))
+    return tokens
+
+
+def _pack_strings(strings):
+    return np.frombuffer("\n".join(strings).encode("utf-8"), dtype=np.uint8)
+
+
+def _unpack_strings(packed):
+    text = packed.tobytes().decode("utf-8")
+    return text.split("\n") if text else []
+
+
+# Okapi BM25 over the chunks of one collection. Postings are stored CSR-style: the documents
+# and term frequencies of term i are docs[offsets[i]:offsets[i + 1]], which keeps the index a
+# handful of flat numpy arrays that save to and load from a single compressed .npz file.
+class BM25Index:
+    def __init__(self, ids, vocab, offsets, docs, freqs, doc_lengths, k1=DEFAULT_K1, b=DEFAULT_B):
+        self.ids = ids
+        self.vocab = vocab
+        self.term_index = {term: i for i, term in enumerate(vocab)}
+        self.offsets = offsets
+        self.docs = docs
+        self.freqs = freqs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+
+        # Length normalization only depends on the document, so it is computed once
+        average_length = doc_lengths.mean() if len(doc_lengths) else 0.0
+        self.length_norm = (k1 * (1 - b + b * doc_lengths / max(average_length, 1e-9))).astype(np.float32)
+
+    @classmethod
+    def build(cls, ids, texts, k1=DEFAULT_K1, b=DEFAULT_B):
+        # Collect (term id, frequency) per document, then sort all postings by term in one go
+        term_ids = {}
+        doc_terms = []
+        doc_freqs = []
+        doc_lengths = np.zeros(len(texts), dtype=np.int32)
+        for doc, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lengths[doc] = sum(counts.values())
+            doc_terms.append(np.fromiter((term_ids.setdefault(term, len(term_ids)) for term in counts),
+                                         dtype=np.int64, count=len(counts)))
+            doc_freqs.append(np.fromiter(counts.values(), dtype=np.int64, count=len(counts)))
+
+        # Term ids are renumbered in sorted vocabulary order
+        vocab = sorted(term_ids)
+        rank = np.empty(len(vocab), dtype=np.int64)
+        rank[[term_ids[term] for term in vocab]] = np.arange(len(vocab))
+
+        terms = rank[np.concatenate(doc_terms)] if doc_terms else np.zeros(0, dtype=np.int64)
+        docs = np.repeat(np.arange(len(texts), dtype=np.int32), [len(t) for t in doc_terms])
+        freqs = np.concatenate(doc_freqs) if doc_freqs else np.zeros(0, dtype=np.int64)
+
+        order = np.argsort(terms, kind="stable")
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(terms, minlength=len(vocab)))
+        freqs = np.minimum(freqs[order], np.iinfo(np.uint16).max).astype(np.uint16)
+        return cls(list(ids), vocab, offsets, docs[order], freqs, doc_lengths, k1, b)
+
+    def update(self, removed_ids, ids, texts):
+        # A new index without the chunks of removed_ids and with ids/texts added (replacing the
+        # chunks of the same ids), merged from the existing postings so only the added chunks
+        # are tokenized
+        added = BM25Index.build(ids, texts, self.k1, self.b)
+        dropped = set(removed_ids) | set(added.ids)
+        keep = np.fromiter((chunk_id not in dropped for chunk_id in self.ids), dtype=bool, count=len(self.ids))
+        kept_count = int(keep.sum())
+        new_doc = np.cumsum(keep) - 1
+
+        posting_terms = np.repeat(np.arange(len(self.vocab), dtype=np.int64), np.diff(self.offsets))
+        kept_postings = keep[self.docs]
+        old_terms = posting_terms[kept_postings]
+
+        # Terms left without postings drop out of the vocabulary
+        used = np.unique(old_terms)
+        vocab = sorted({self.vocab[i] for i in used} | set(added.vocab))
+        term_index = {term: i for i, term in enumerate(vocab)}
+        old_rank = np.full(len(self.vocab), -1, dtype=np.int64)
+        old_rank[used] = [term_index[self.vocab[i]] for i in used]
+        added_rank = np.array([term_index[term] for term in added.vocab], dtype=np.int64)
+        added_terms = np.repeat(np.arange(len(added.vocab), dtype=np.int64), np.diff(added.offsets))
+
+        terms = np.concatenate([old_rank[old_terms], added_rank[added_terms]])
+        docs = np.concatenate([new_doc[self.docs[kept_postings]], added.docs + kept_count]).astype(np.int32)
+        freqs = np.concatenate([self.freqs[kept_postings], added.freqs])
+
+        order = np.argsort(terms, kind="stable")
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(terms, minlength=len(vocab)))
+        ids = [chunk_id for chunk_id, kept in zip(self.ids, keep) if kept] + added.ids
+        doc_lengths = np.concatenate([self.doc_lengths[keep], added.doc_lengths])
+        return BM25Index(ids, vocab, offsets, docs[order], freqs[order], doc_lengths, self.k1, self.b)
+
+    def save(self, path):
+        # Write to a temporary file first so the API never loads a torn index
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            ids=_pack_strings(self.ids),
+            vocab=_pack_strings(self.vocab),
+            offsets=self.offsets,
+            docs=self.docs,
+            freqs=self.freqs,
+            doc_lengths=self.doc_lengths,
+            params=np.array([self.k1, self.b]),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            k1, b = data["params"]
+            return cls(
+                _unpack_strings(data["ids"]),
+                _unpack_strings(data["vocab"]),
+                data["offsets"],
+                data["docs"],
+                data["freqs"],
+                data["doc_lengths"],
+                float(k1),
+                float(b),
+            )
+
+    def search(self, query, k=5):
+        # Returns up to k (chunk id, score) pairs, best first
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        total = len(self.ids)
+        for term in set(tokenize(query)):
+            i = self.term_index.get(term)
+            if i is None:
+                continue
+            start, end = self.offsets[i], self.offsets[i + 1]
+            docs = self.docs[start:end]
+            freqs = self.freqs[start:end].astype(np.float32)
+            idf = np.log(1 + (total - (end - start) + 0.5) / ((end - start) + 0.5))
+            scores[docs] += idf * freqs * (self.k1 + 1) / (freqs + self.length_norm[docs])
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(self.ids[doc], float(scores[doc])) for doc in matched]
+
+
+# Merge ranked result lists by reciprocal rank fusion: each item scores sum(1 / (rrf_k + rank))
+# over the lists it appears in, so items ranked well by several retrievers rise to the top
+def reciprocal_rank_fusion(result_lists, key, rrf_k=DEFAULT_RRF_K):
+    scores = {}
+    items = {}
+    for results in result_lists:
+        for rank, item in enumerate(results, start=1):
+            item_key = key(item)
+            scores[item_key] = scores.get(item_key, 0.0) + 1 / (rrf_k + rank)
+            items.setdefault(item_key, item)
+    return [items[item_key] for item_key in sorted(scores, key=scores.get, reverse=True)]
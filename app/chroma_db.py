@@ -1,25 +1,138 @@
-import chromadb
-from sentence_transformers import SentenceTransformer
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
+import os
+import threading
+import time
 
+from langchain_core.documents import Document
+
+from bm25 import BM25Index, bm25_index_path, reciprocal_rank_fusion
+from embedding_cache import CachedEmbeddings
+from index_state import active_collection_name, index_state_path, read_index_state
+from metrics import Metrics
+from query_batcher import DEFAULT_LRU_SIZE, DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT_MS, BatchingQueryEmbeddings
+
+# Registry of the supported frameworks and the Chroma collection holding each one's docs.
+# Adding a framework only takes an entry here (and a loader that fills its collection).
+FRAMEWORKS = {
+    "FastAPI": {"collection": "FastAPI"},
+    "Django": {"collection": "Django"},
+    "RubyOnRails": {"collection": "RubyOnRails"},
+    "Flutter": {"collection": "Flutter"},
+}
+
+# A collection version that failed to open is not tried again for this long
+SWITCH_RETRY_SECONDS = 30
+
+# Nothing is loaded up front: the Chroma client, the embedding model and each framework's
+# index are created on first use (or by warm_up), so importing the app stays fast. chromadb,
+# langchain_chroma and the sentence-transformers stack are only imported at that point too.
 class ChromaDBHandler:
-    def __init__(self, db_path="../chroma_db", model_name="all-MiniLM-L6-v2"):
+    def __init__(self, db_path="../chroma_db", model_name="all-MiniLM-L6-v2", cache_dir="../embedding_cache",
+                 query_batch_size=DEFAULT_MAX_BATCH_SIZE, query_batch_wait_ms=DEFAULT_MAX_WAIT_MS,
+                 query_lru_size=DEFAULT_LRU_SIZE, frameworks=None, metrics=None, embedding_backend="torch",
+                 embedding_threads=None, onnx_dir="../onnx_models", embedding_service=None):
+        self.db_path = db_path
+        self.model_name = model_name
+        self.embedding_backend = embedding_backend
+        self.embedding_threads = embedding_threads
+        self.onnx_dir = onnx_dir
+        self.embedding_service = embedding_service
+        self.cache_dir = cache_dir
+        self.query_batch_size = query_batch_size
+        self.query_batch_wait_ms = query_batch_wait_ms
+        self.query_lru_size = query_lru_size
+        self.frameworks = FRAMEWORKS if frameworks is None else frameworks
+
+        # Search stage timings go to the app's metrics; by default they are not recorded
+        self.metrics = metrics or Metrics(enabled=False)
+
+        self.lock = threading.RLock()
+        self._client = None
+        self._base_embedding_model = None
+        self._embedding_model = None
+
+        # Open index of each framework, as (index, collection name, generation)
+        self.indices = {}
+
+        # Frameworks whose index is being switched to a rebuilt version, and the last version
+        # that failed to open per framework, as (collection name, monotonic time)
+        self.switching = set()
+        self.switch_failures = {}
+
+        # BM25 indices built by the loaders, with the index generation each was loaded at
+        self.bm25_indices = {}
+
+        # Seconds each component took to load, for the readiness report
+        self.load_seconds = {}
+
+        # Index generations written by the loaders, re-read whenever the state file changes
+        self.index_state = {}
+        self.index_state_mtime = None
+
+    @property
+    def client(self):
         # Initialize the Persistent ChromaDB Client
-        self.client = chromadb.PersistentClient(path=db_path)
+        with self.lock:
+            if self._client is None:
+                import chromadb
 
-        # Initialize the Embedding Model
-        self.embedding_model = HuggingFaceEmbeddings(model_name=model_name)
+                started_at = time.perf_counter()
+                self._client = chromadb.PersistentClient(path=self.db_path)
+                self.load_seconds["client"] = time.perf_counter() - started_at
+            return self._client
 
-        # Initialize all framework indices at once
-        self.indices = {
-            "FastAPI": self._create_chroma_index("FastAPI"),
-            "Django": self._create_chroma_index("Django"),
-            "RubyOnRails": self._create_chroma_index("RubyOnRails"),
-            "Flutter": self._create_chroma_index("Flutter")
-        }
+    def _load_base_model(self):
+        # The embedding service's client when embedding_service (its socket) is set, else the
+        # model itself on the configured backend
+        if self.embedding_service:
+            from embedding_service import RemoteEmbeddings
+
+            return RemoteEmbeddings(self.embedding_service)
+
+        from hf_embeddings import load_embeddings
+
+        return load_embeddings(self.model_name, self.embedding_backend, self.embedding_threads, self.onnx_dir)
+
+    def preload_model(self):
+        # Load the model weights without starting any thread or opening the embedding cache, so
+        # a pre-forking server can load them once before forking and its workers share them
+        # copy-on-write; the rest of embedding_model is still set up in each worker
+        with self.lock:
+            if self._base_embedding_model is None:
+                started_at = time.perf_counter()
+                self._base_embedding_model = self._load_base_model()
+                self.load_seconds["embedding_model_preload"] = time.perf_counter() - started_at
+
+    @property
+    def embedding_model(self):
+        with self.lock:
+            if self._embedding_model is None:
+                from hf_embeddings import embedding_cache_name
+
+                started_at = time.perf_counter()
+                embedding_model = self._base_embedding_model or self._load_base_model()
+
+                # The persistent embedding cache sits in front of the model unless cache_dir is
+                # None; with an embedding service, the service keeps it instead
+                if self.cache_dir is not None and not self.embedding_service:
+                    embedding_model = CachedEmbeddings(
+                        embedding_model, embedding_cache_name(self.model_name, self.embedding_backend), self.cache_dir
+                    )
+
+                # Concurrent query embeddings are coalesced into batched forward passes. The
+                # embedding service already waits for its batches to fill, so in front of it
+                # queries only batch up while a round trip is in flight, without waiting twice.
+                self._embedding_model = BatchingQueryEmbeddings(
+                    embedding_model,
+                    max_batch_size=self.query_batch_size,
+                    max_wait_ms=0 if self.embedding_service else self.query_batch_wait_ms,
+                    lru_size=self.query_lru_size
+                )
+                self.load_seconds["embedding_model"] = time.perf_counter() - started_at
+            return self._embedding_model
 
     def _create_chroma_index(self, collection_name):
+        from langchain_chroma import Chroma
+
         # Create and return a Chroma index for the given collection name
         return Chroma(
             collection_name=collection_name,
@@ -27,14 +140,178 @@ class ChromaDBHandler:
             client=self.client
         )
 
-    def get_index(self, framework) -> Chroma:
-        # Get the Chroma index for a specific framework
-        return self.indices.get(framework, None)
+    def get_index(self, framework) -> "Chroma":
+        # Get the Chroma index for a specific framework, opening it on first use
+        served = self._serve(framework)
+        return served[0] if served is not None else None
+
+    def _serve(self, framework):
+        # The framework's open index as (index, collection name, generation). When a rebuild has
+        # swapped in a new version of the collection, the version served so far keeps answering
+        # while the new one is opened and warmed up in the background, then takes over. Only the
+        # version swapped out last is sure to be kept by the loaders, so a handler that is more
+        # than one swap behind switches right away instead.
+        if framework not in self.frameworks:
+            return None
+        collection_name, generation, previous_name = self._active_collection(framework)
+        served = self.indices.get(framework)
+        if served is not None and served[1] == collection_name:
+            return served
+        with self.lock:
+            served = self.indices.get(framework)
+            if served is None:
+                started_at = time.perf_counter()
+                served = (self._create_chroma_index(collection_name), collection_name, generation)
+                self.indices[framework] = served
+                self.load_seconds[f"index:{framework}"] = time.perf_counter() - started_at
+            elif served[1] != collection_name and served[1] != previous_name:
+                self._switch_index(framework, collection_name, generation)
+                served = self.indices[framework]
+            elif served[1] != collection_name and framework not in self.switching:
+                failed = self.switch_failures.get(framework)
+                if failed is None or failed[0] != collection_name or time.monotonic() - failed[1] > SWITCH_RETRY_SECONDS:
+                    self.switching.add(framework)
+                    threading.Thread(
+                        target=self._switch_index, args=(framework, collection_name, generation),
+                        name=f"index-switch-{framework}", daemon=True
+                    ).start()
+            return served
+
+    def _switch_index(self, framework, collection_name, generation):
+        try:
+            started_at = time.perf_counter()
+            index = self._create_chroma_index(collection_name)
+            # The first search loads the collection; it is paid here rather than by a user
+            index.similarity_search_by_vector(self.embedding_model.embed_query("warm up"), k=1)
+            with self.lock:
+                self.indices[framework] = (index, collection_name, generation)
+            self.load_seconds[f"index:{framework}"] = time.perf_counter() - started_at
+            print(f"Switched {framework} to collection {collection_name} (index generation {generation})")
+        except Exception as e:
+            self.switch_failures[framework] = (collection_name, time.monotonic())
+            print(f"Failed to switch {framework} to collection {collection_name}: {e}")
+        finally:
+            with self.lock:
+                self.switching.discard(framework)
+
+    def get_bm25_index(self, framework, served=None):
+        # The BM25 index of the collection version being served, reloaded whenever an ingest
+        # moves the index generation; None when the loaders have not built one
+        served = served or self._serve(framework)
+        collection_name, generation = served[1], self.get_generation(framework)
+        loaded = self.bm25_indices.get(framework)
+        if loaded is not None and loaded[1] == (collection_name, generation):
+            return loaded[0]
+        with self.lock:
+            path = bm25_index_path(self.db_path, collection_name)
+            started_at = time.perf_counter()
+            index = BM25Index.load(path) if os.path.exists(path) else None
+            self.bm25_indices[framework] = (index, (collection_name, generation))
+            if index is not None:
+                self.load_seconds[f"bm25:{framework}"] = time.perf_counter() - started_at
+            return index
+
+    def _get_documents(self, index, ids):
+        # Fetch chunks by id, in the order of `ids`; ids no longer in the collection are skipped
+        if not ids:
+            return []
+        result = index.get(ids=ids, include=["documents", "metadatas"])
+        found = {
+            chunk_id: Document(page_content=text, metadata=metadata or {})
+            for chunk_id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"])
+        }
+        return [found[chunk_id] for chunk_id in ids if chunk_id in found]
+
+    def search(self, framework, query_text, query_vector, k=5, candidates=20, hybrid=True):
+        # Vector search, fused with BM25 keyword search by reciprocal rank fusion when the
+        # framework has a BM25 index: both retrievers contribute `candidates` results each
+        served = self._serve(framework)
+        index = served[0]
+        bm25_index = self.get_bm25_index(framework, served) if hybrid else None
+        if bm25_index is None:
+            with self.metrics.timer("vector_search"):
+                return index.similarity_search_by_vector(query_vector, k=k)
+
+        with self.metrics.timer("vector_search"):
+            vector_docs = index.similarity_search_by_vector(query_vector, k=candidates)
+        with self.metrics.timer("bm25_search"):
+            lexical_ids = [chunk_id for chunk_id, _ in bm25_index.search(query_text, candidates)]
+        with self.metrics.timer("fetch_documents"):
+            lexical_docs = self._get_documents(index, lexical_ids)
+        return reciprocal_rank_fusion([vector_docs, lexical_docs], key=lambda doc: doc.page_content)[:k]
+
+    def warm_up(self, frameworks=None):
+        # Load the model and open the indices ahead of the first query; one query is embedded so
+        # the model's first forward pass is not paid by a user either
+        self.embedding_model.embed_query("warm up")
+        for framework in frameworks or self.frameworks:
+            self.get_index(framework)
+            self.get_bm25_index(framework)
+
+    def status(self):
+        return {
+            "embedding_model_loaded": self._embedding_model is not None,
+            "embedding_backend": self.embedding_backend,
+            "embedding_mode": self.embedding_mode(),
+            "indices": {framework: framework in self.indices for framework in self.frameworks},
+            "collections": {framework: self.indices[framework][1] for framework in self.frameworks if framework in self.indices},
+            "bm25_indices": {
+                framework: self.bm25_indices.get(framework, (None,))[0] is not None for framework in self.frameworks
+            },
+            "load_seconds": {name: round(seconds, 3) for name, seconds in self.load_seconds.items()},
+        }
+
+    def embedding_mode(self):
+        if self.embedding_service:
+            return "service"
+        return "preloaded" if self._base_embedding_model is not None else "in_process"
+
+    def query_embedding_stats(self):
+        # Batching stats, without loading the model just to report them; with an embedding
+        # service, also the round trips to it
+        if self._embedding_model is None:
+            return {}
+        stats = self._embedding_model.stats()
+        if self.embedding_service:
+            stats["service"] = self._embedding_model.embeddings.stats()
+        return stats
+
+    def submit_query(self, query_text):
+        return self.embedding_model.submit(query_text)
+
+    def close(self):
+        if self._embedding_model is not None:
+            self._embedding_model.close()
+            if self.embedding_service:
+                self._embedding_model.embeddings.close()
+
+    def _active_collection(self, framework):
+        # The collection version serving a framework, its index generation and the version it
+        # replaced, as last published by the loaders; the state file is re-read whenever it changes
+        try:
+            mtime = os.stat(index_state_path(self.db_path)).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self.index_state_mtime:
+            self.index_state = read_index_state(self.db_path) if mtime is not None else {}
+            self.index_state_mtime = mtime
+        collection_name = self.frameworks[framework]["collection"]
+        entry = self.index_state.get(collection_name, {})
+        return active_collection_name(self.index_state, collection_name), entry.get("generation", 0), entry.get("previous")
+
+    def get_generation(self, framework):
+        # Index generation of the framework's collection; bumped by every ingest that changes it.
+        # While a rebuilt version warms up, the generation of the version still being served.
+        collection_name, generation, _ = self._active_collection(framework)
+        served = self.indices.get(framework)
+        if served is not None and served[1] != collection_name:
+            return served[2]
+        return generation
 
     def query_vectorstore(self, query_text, framework, top_k=5):
         try:
             print(f"Generating embedding for query: '{query_text}'")
-            vectorstore = self.get_index(framework, None)
+            vectorstore = self.get_index(framework)
 
             if vectorstore:
                 # Query the vectorstore for similar documents
@@ -0,0 +1,184 @@
+import re
+import threading
+
+# Default number of context tokens sent to the LLM per question
+DEFAULT_TOKEN_BUDGET = 1500
+
+# Encoding of gpt-4o-mini
+DEFAULT_ENCODING = "o200k_base"
+
+# Shortest suffix/prefix match taken as the splitter overlap between chunks without offsets
+MIN_TEXT_OVERLAP = 20
+
+# A passage that does not fit is still truncated into the budget when this many tokens are left
+MIN_TRUNCATED_TOKENS = 64
+
+PASSAGE_SEPARATOR = "\n\n"
+
+
+# Token counting with tiktoken's encoding of the model. The encoding is loaded on first use
+# (tiktoken downloads it once, or reads it from TIKTOKEN_CACHE_DIR); if it cannot be loaded,
+# tokens are estimated at ~4 characters each so that packing still works.
+class Tokenizer:
+    def __init__(self, encoding_name=DEFAULT_ENCODING):
+        self.encoding_name = encoding_name
+        self.encoding = None
+        self.estimated = False
+        self.lock = threading.Lock()
+
+    def _load(self):
+        with self.lock:
+            if self.encoding is None and not self.estimated:
+                try:
+                    import tiktoken
+
+                    self.encoding = tiktoken.get_encoding(self.encoding_name)
+                except Exception as e:
+                    print(f"Could not load the {self.encoding_name} tokenizer, estimating token counts instead: {e}")
+                    self.estimated = True
+
+    def count(self, text):
+        self._load()
+        if self.encoding is None:
+            return (len(text) + 3) // 4
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text, max_tokens):
+        self._load()
+        if self.encoding is None:
+            return text[:max_tokens * 4]
+        return self.encoding.decode(self.encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _source_key(doc):
+    return (doc.metadata.get("source"), doc.metadata.get("page"))
+
+
+def _text_overlap(left, right):
+    # Longest suffix of `left` that is a prefix of `right`, if at least MIN_TEXT_OVERLAP long
+    for size in range(min(len(left), len(right)) - 1, MIN_TEXT_OVERLAP - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+class _Passage:
+    def __init__(self, doc, rank):
+        self.text = doc.page_content
+        self.start = doc.metadata.get("start_index")
+        self.rank = rank
+        self.chunks = 1
+
+    @property
+    def end(self):
+        return self.start + len(self.text)
+
+    def absorb(self, other, text):
+        self.text = text
+        self.rank = min(self.rank, other.rank)
+        self.chunks += other.chunks
+
+
+def _merge_by_offset(passages):
+    passages.sort(key=lambda passage: passage.start)
+    merged = [passages[0]]
+    for passage in passages[1:]:
+        current = merged[-1]
+        if passage.start <= current.end:
+            # Overlapping or touching: keep only the part of the next chunk past the current end
+            current.absorb(passage, current.text + passage.text[current.end - passage.start:])
+        else:
+            merged.append(passage)
+    return merged
+
+
+def _merge_by_text(passages):
+    merged = list(passages)
+    changed = True
+    while changed:
+        changed = False
+        for left in merged:
+            for right in merged:
+                if left is right:
+                    continue
+                if right.text in left.text:
+                    left.absorb(right, left.text)
+                else:
+                    overlap = _text_overlap(left.text, right.text)
+                    if not overlap:
+                        continue
+                    left.absorb(right, left.text + right.text[overlap:])
+                merged.remove(right)
+                changed = True
+                break
+            if changed:
+                break
+    return merged
+
+
+# Turns the retrieved chunks into the prompt context. Chunks from the same source (and page)
+# are merged where they overlap or touch, by their start offsets when the splitter recorded
+# them and by matching text otherwise; exact and contained duplicates are dropped; and the
+# passages are packed best-ranked first into `token_budget` tokens.
+class ContextBuilder:
+    def __init__(self, token_budget=DEFAULT_TOKEN_BUDGET, tokenizer=None):
+        self.token_budget = token_budget
+        self.tokenizer = tokenizer or Tokenizer()
+
+    def merge(self, docs):
+        groups = {}
+        for rank, doc in enumerate(docs):
+            groups.setdefault(_source_key(doc), []).append(_Passage(doc, rank))
+
+        passages = []
+        for group in groups.values():
+            if all(passage.start is not None for passage in group):
+                group = _merge_by_offset(group)
+            passages.extend(_merge_by_text(group))
+
+        # Drop passages repeated verbatim (after whitespace normalization) across sources
+        passages.sort(key=lambda passage: passage.rank)
+        unique = []
+        seen = []
+        for passage in passages:
+            normalized = _normalize(passage.text)
+            if any(normalized in other for other in seen):
+                continue
+            seen.append(normalized)
+            unique.append(passage)
+        return unique
+
+    def build(self, docs):
+        # Returns the context and a summary of what was packed
+        passages = self.merge(docs)
+        retrieved_tokens = sum(self.tokenizer.count(doc.page_content) for doc in docs)
+        separator_tokens = self.tokenizer.count(PASSAGE_SEPARATOR)
+
+        parts = []
+        used = 0
+        for passage in passages:
+            cost = self.tokenizer.count(passage.text) + (separator_tokens if parts else 0)
+            remaining = self.token_budget - used
+            if cost <= remaining:
+                parts.append(passage.text)
+                used += cost
+                continue
+            if remaining >= MIN_TRUNCATED_TOKENS:
+                parts.append(self.tokenizer.truncate(passage.text, remaining - separator_tokens))
+                used = self.token_budget
+            break
+
+        stats = {
+            "chunks": len(docs),
+            "passages": len(passages),
+            "packed_passages": len(parts),
+            "retrieved_tokens": retrieved_tokens,
+            "context_tokens": used,
+            "token_budget": self.token_budget,
+            "estimated": self.tokenizer.estimated,
+        }
+        return PASSAGE_SEPARATOR.join(parts), stats
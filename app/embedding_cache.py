@@ -0,0 +1,304 @@
+import hashlib
+import mmap
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Default on-disk budget of the cached vectors per model
+DEFAULT_CACHE_SIZE_MB = 512
+
+# SQLite caps the number of bound parameters per statement
+_SQL_BATCH = 500
+
+# Seconds between write-backs of the last use of cache hits
+RECENCY_FLUSH_SECONDS = 30.0
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _row_runs(slots):
+    # Consecutive rows as [first, last] runs
+    runs = []
+    for slot in sorted(slots):
+        if runs and slot == runs[-1][1] + 1:
+            runs[-1][1] = slot
+        else:
+            runs.append([slot, slot])
+    return runs
+
+
+# Embeddings wrapper that serves vectors from an on-disk cache keyed by (model name, text hash)
+# and only runs the wrapped model on misses. Vectors live in a memory-mapped float32 array file;
+# a SQLite table maps each text hash to its row and last use, and the least recently used rows
+# are evicted once the file reaches its size budget. Several processes (loaders, API workers)
+# can share one cache directory: SQLite serializes index updates, and every row carries a tag of
+# its hash. A row's tag is cleared while its vector is rewritten and readers check it again after
+# copying the vector, so a row overwritten by another process during a lookup counts as a miss.
+# The number of rows is fixed by the process that creates the cache (from its max_size_mb) and
+# recorded next to the vector width, so every process maps the same files the same way.
+# Lookups only read SQLite: the last use of hits is kept in memory and written back in batches,
+# so cache hits on the query path never wait for the write lock. Query misses are stored on a
+# best-effort basis: while another process holds the write lock (a loader storing a batch), the
+# store is skipped rather than waited for, and the batcher's in-memory LRU still has them.
+class CachedEmbeddings(Embeddings):
+    def __init__(self, embeddings, model_name, cache_dir, max_size_mb=DEFAULT_CACHE_SIZE_MB):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.path = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        os.makedirs(self.path, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(self.path, "index.sqlite"), timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # The cache can always be recomputed, so commits skip the fsync (a crash may lose the
+        # last ones, never corrupt the index)
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries "
+            "(hash TEXT PRIMARY KEY, slot INTEGER NOT NULL UNIQUE, last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self.conn.commit()
+
+        self.vectors = None
+        self.tags = None
+        self.capacity = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.skipped_stores = 0
+
+        # Last use of the hits not written back yet, by hash
+        self.recency = {}
+        self.recency_flushed_at = time.monotonic()
+
+        # The vector width is only known once the model has produced a vector
+        dim = self._get_meta("dim")
+        if dim is not None:
+            self._open_arrays(int(dim))
+
+    def _get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _open_arrays(self, dim):
+        # The first process to open the arrays records their number of rows, from its budget (or
+        # from the files of a cache created before it was recorded); every process then maps that
+        # many, so a smaller budget never shrinks the cache under a process with a larger one.
+        # Unused rows stay sparse on disk.
+        vectors_path = os.path.join(self.path, "vectors.f32")
+        tags_path = os.path.join(self.path, "tags.u64")
+        if self._get_meta("capacity") is None:
+            existing = os.path.getsize(vectors_path) // (dim * 4) if os.path.exists(vectors_path) else 0
+            capacity = existing or max(self.max_bytes // (dim * 4), 1)
+            self.conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('capacity', ?)", (str(capacity),))
+            self.conn.commit()
+        self.capacity = int(self._get_meta("capacity"))
+        for file_path, row_bytes in ((vectors_path, dim * 4), (tags_path, 8)):
+            with open(file_path, "ab") as file:
+                if file.tell() < self.capacity * row_bytes:
+                    file.truncate(self.capacity * row_bytes)
+
+        # The arrays are views over mappings of their own, so stores can sync just the rows
+        # they wrote
+        with open(vectors_path, "r+b") as file:
+            self.vectors_map = mmap.mmap(file.fileno(), self.capacity * dim * 4)
+        with open(tags_path, "r+b") as file:
+            self.tags_map = mmap.mmap(file.fileno(), self.capacity * 8)
+        self.vectors = np.ndarray((self.capacity, dim), dtype=np.float32, buffer=self.vectors_map)
+        self.tags = np.ndarray((self.capacity,), dtype=np.uint64, buffer=self.tags_map)
+
+    @staticmethod
+    def _tag(digest):
+        return np.uint64(int(digest[:16], 16))
+
+    def _lookup(self, digests):
+        # Returns {hash: vector} for the cached hashes and marks them as recently used
+        found = {}
+        if self.vectors is None:
+            return found
+        unique = list(dict.fromkeys(digests))
+        for start in range(0, len(unique), _SQL_BATCH):
+            batch = unique[start:start + _SQL_BATCH]
+            rows = self.conn.execute(
+                f"SELECT hash, slot FROM entries WHERE hash IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+            for digest, slot in rows:
+                if slot >= self.capacity:
+                    continue
+                tag = self._tag(digest)
+                if self.tags[slot] == tag:
+                    vector = self.vectors[slot].tolist()
+                    # The row may have been evicted and refilled while it was copied
+                    if self.tags[slot] == tag:
+                        found[digest] = vector
+
+        now = time.time()
+        self.recency.update((digest, now) for digest in found)
+        if time.monotonic() - self.recency_flushed_at >= RECENCY_FLUSH_SECONDS:
+            self._try_flush_recency()
+        return found
+
+    def _write_recency(self):
+        # Write the pending last uses back; runs inside the caller's write transaction
+        items = list(self.recency.items())
+        for start in range(0, len(items), _SQL_BATCH):
+            self.conn.executemany("UPDATE entries SET last_used = ? WHERE hash = ?",
+                                  [(last_used, digest) for digest, last_used in items[start:start + _SQL_BATCH]])
+        self.recency.clear()
+        self.recency_flushed_at = time.monotonic()
+
+    def _try_flush_recency(self):
+        # Without waiting for the write lock: while another process holds it (a loader storing a
+        # batch), the last uses stay pending until the next attempt or the next store
+        if not self.recency or not self._begin_write(wait=False):
+            self.recency_flushed_at = time.monotonic()
+            return
+        try:
+            self._write_recency()
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+    def _begin_write(self, wait=True):
+        # BEGIN IMMEDIATE takes the write lock up front so concurrent writers never hand out the
+        # same row. Without wait, it gives up at once (returning False) while another process
+        # holds the lock.
+        if wait:
+            self.conn.execute("BEGIN IMMEDIATE")
+            return True
+        self.conn.execute("PRAGMA busy_timeout = 0")
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+            return True
+        except sqlite3.OperationalError:
+            return False
+        finally:
+            self.conn.execute("PRAGMA busy_timeout = 30000")
+
+    def _flush_rows(self, slots):
+        # Sync the pages of the rows just written rather than the whole mappings
+        for mapping, row_bytes in ((self.vectors_map, self.vectors.shape[1] * 4), (self.tags_map, 8)):
+            for first, last in _row_runs(slots):
+                start = first * row_bytes // mmap.PAGESIZE * mmap.PAGESIZE
+                mapping.flush(start, (last + 1) * row_bytes - start)
+
+    def _allocate(self, count):
+        # Hand out never-used rows first, then evict the least recently used entries
+        next_slot = int(self._get_meta("next_slot") or 0)
+        slots = list(range(next_slot, min(next_slot + count, self.capacity)))
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('next_slot', ?)", (str(next_slot + len(slots)),)
+        )
+        missing = count - len(slots)
+        if missing > 0:
+            evicted = self.conn.execute(
+                "SELECT hash, slot FROM entries ORDER BY last_used LIMIT ?", (missing,)
+            ).fetchall()
+            for start in range(0, len(evicted), _SQL_BATCH):
+                batch = [digest for digest, _ in evicted[start:start + _SQL_BATCH]]
+                self.conn.execute(f"DELETE FROM entries WHERE hash IN ({','.join('?' * len(batch))})", batch)
+            slots.extend(slot for _, slot in evicted)
+            self.evictions += len(evicted)
+        return slots
+
+    def _store(self, digests, vectors, wait=True):
+        if self.vectors is None:
+            dim = len(vectors[0])
+            self.conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('dim', ?)", (str(dim),))
+            self.conn.commit()
+            self._open_arrays(int(self._get_meta("dim")))
+
+        new = {}
+        for digest, vector in zip(digests, vectors):
+            new.setdefault(digest, vector)
+
+        now = time.time()
+        if not self._begin_write(wait):
+            self.skipped_stores += 1
+            return
+        try:
+            # Another process may have stored some of these in the meantime
+            placeholders = ",".join("?" * len(new))
+            for (digest,) in self.conn.execute(
+                f"SELECT hash FROM entries WHERE hash IN ({placeholders})", list(new)
+            ).fetchall():
+                new.pop(digest, None)
+
+            # Evictions go by the last uses of this process's hits too
+            self._write_recency()
+            items = list(new.items())
+            slots = self._allocate(len(items))
+            for (digest, vector), slot in zip(items, slots):
+                # No reader takes the row for its old hash (or the new one) while it is rewritten
+                self.tags[slot] = 0
+                self.vectors[slot] = vector
+                self.tags[slot] = self._tag(digest)
+            self._flush_rows(slots)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO entries (hash, slot, last_used) VALUES (?, ?, ?)",
+                [(digest, slot, now) for (digest, _), slot in zip(items, slots)],
+            )
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+    def _embed_cached(self, digests, texts, compute, wait=True):
+        with self.lock:
+            cached = self._lookup(digests)
+
+        # Run the model once over every distinct text that is not cached yet
+        missing = list(dict.fromkeys(digest for digest in digests if digest not in cached))
+        misses = sum(1 for digest in digests if digest not in cached)
+        self.hits += len(digests) - misses
+        self.misses += misses
+        if missing:
+            texts_by_digest = dict(zip(digests, texts))
+            computed = compute([texts_by_digest[digest] for digest in missing])
+            with self.lock:
+                for start in range(0, len(missing), _SQL_BATCH):
+                    self._store(missing[start:start + _SQL_BATCH], computed[start:start + _SQL_BATCH], wait)
+            cached.update(zip(missing, computed))
+
+        return [list(cached[digest]) for digest in digests]
+
+    def embed_documents(self, texts):
+        digests = [text_hash(text) for text in texts]
+        return self._embed_cached(digests, texts, self.embeddings.embed_documents)
+
+    def embed_query(self, text):
+        # Queries are keyed apart from documents since models may embed them differently, and
+        # their misses are only stored when the write lock is free
+        digest = text_hash(f"query\0{text}")
+        return self._embed_cached([digest], [text], lambda texts: [self.embeddings.embed_query(texts[0])], wait=False)[0]
+
+    def embed_queries(self, texts):
+        # Batched embed_query: the misses go through the wrapped model's embed_queries when it has one
+        digests = [text_hash(f"query\0{text}") for text in texts]
+        compute = getattr(self.embeddings, "embed_queries", None)
+        if compute is None:
+            compute = lambda misses: [self.embeddings.embed_query(text) for text in misses]
+        return self._embed_cached(digests, texts, compute, wait=False)
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def cache_report(self):
+        return (
+            f"Embedding cache {self.model_name}: {self.hits} hits, {self.misses} misses "
+            f"({self.hit_rate():.1%} hit rate), {self.evictions} evictions, "
+            f"{self.skipped_stores} stores skipped while the cache was busy"
+        )
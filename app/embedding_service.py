@@ -0,0 +1,273 @@
+import argparse
+import asyncio
+import json
+import os
+import queue
+import signal
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from metrics import process_memory
+from query_batcher import DEFAULT_LRU_SIZE, DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT_MS, BatchingQueryEmbeddings
+
+DEFAULT_SOCKET_PATH = "/tmp/docubot-embeddings.sock"
+
+# Idle connections each client keeps open to the service, and how long a request may take
+DEFAULT_POOL_SIZE = 8
+DEFAULT_TIMEOUT_SECONDS = 30.0
+
+# Messages both ways are a length-prefixed JSON header followed by a length-prefixed payload;
+# vectors travel as raw float32 rows in the payload, so no float goes through JSON
+_LENGTH = struct.Struct("!I")
+
+
+def _pack(header, payload=b""):
+    data = json.dumps(header).encode("utf-8")
+    return _LENGTH.pack(len(data)) + data + _LENGTH.pack(len(payload)) + payload
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("The embedding service closed the connection")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _recv_message(sock):
+    (size,) = _LENGTH.unpack(_recv_exactly(sock, _LENGTH.size))
+    header = json.loads(_recv_exactly(sock, size))
+    (size,) = _LENGTH.unpack(_recv_exactly(sock, _LENGTH.size))
+    return header, _recv_exactly(sock, size)
+
+
+async def _read_message(reader):
+    (size,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    header = json.loads(await reader.readexactly(size))
+    (size,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    return header, await reader.readexactly(size)
+
+
+# Embedding service shared by the API workers of a host: one process holds the model (and the
+# persistent embedding cache) and embeds for every worker over a Unix socket, so N workers
+# need one copy of the weights instead of N. Queries from all the workers go through one
+# BatchingQueryEmbeddings, so concurrent questions still share forward passes and the LRU.
+class EmbeddingService:
+    def __init__(self, embeddings, socket_path=DEFAULT_SOCKET_PATH, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms=DEFAULT_MAX_WAIT_MS, lru_size=DEFAULT_LRU_SIZE):
+        self.socket_path = socket_path
+        self.batcher = BatchingQueryEmbeddings(
+            embeddings, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms, lru_size=lru_size
+        )
+        self.requests = 0
+        self.connections = 0
+
+    async def _embed(self, header):
+        op = header.get("op")
+        if op == "embed_queries":
+            return await asyncio.gather(*(asyncio.wrap_future(self.batcher.submit(text)) for text in header["texts"]))
+        if op == "embed_documents":
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.batcher.embed_documents, header["texts"])
+        raise ValueError(f"Unknown operation '{op}'")
+
+    async def _respond(self, header):
+        self.requests += 1
+        if header.get("op") == "stats":
+            return _pack(self.stats())
+        try:
+            vectors = np.asarray(await self._embed(header), dtype=np.float32)
+        except Exception as e:
+            return _pack({"error": f"{type(e).__name__}: {e}"})
+        count, dim = vectors.shape if vectors.ndim == 2 else (0, 0)
+        return _pack({"count": count, "dim": dim}, vectors.tobytes())
+
+    async def _handle(self, reader, writer):
+        # Each connection sends one request at a time; clients open more connections for more
+        self.connections += 1
+        try:
+            while True:
+                header, _ = await _read_message(reader)
+                writer.write(await self._respond(header))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def serve(self):
+        # A socket file left behind by a service that did not shut down cleanly is replaced,
+        # one a running service still answers on is not
+        if os.path.exists(self.socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+                raise RuntimeError(f"An embedding service is already listening on {self.socket_path}")
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.remove(self.socket_path)
+            finally:
+                probe.close()
+
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            os.remove(self.socket_path)
+
+    def stats(self):
+        return {
+            "pid": os.getpid(),
+            "requests": self.requests,
+            "connections": self.connections,
+            "memory": process_memory(),
+            **self.batcher.stats(),
+        }
+
+
+# Embeddings client of the embedding service, used by the API workers in place of a local
+# model. Connections are pooled, so a request costs one round trip on an open socket; a request
+# failing on a pooled connection (the service restarted since) is retried once on a new one.
+class RemoteEmbeddings(Embeddings):
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, timeout=DEFAULT_TIMEOUT_SECONDS, pool_size=DEFAULT_POOL_SIZE):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+
+        # Round trips to the service and their total seconds, for the added latency
+        self.round_trips = 0
+        self.round_trip_seconds = 0.0
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise ConnectionError(f"Cannot reach the embedding service at {self.socket_path}: {e}") from e
+        return sock
+
+    def _request(self, header):
+        message = _pack(header)
+        try:
+            sock, pooled = self.idle.get_nowait(), True
+        except queue.Empty:
+            sock, pooled = self._connect(), False
+
+        started_at = time.perf_counter()
+        try:
+            sock.sendall(message)
+            response, payload = _recv_message(sock)
+        except OSError:
+            sock.close()
+            if not pooled:
+                raise
+            sock = self._connect()
+            try:
+                sock.sendall(message)
+                response, payload = _recv_message(sock)
+            except OSError:
+                sock.close()
+                raise
+        with self.lock:
+            self.round_trips += 1
+            self.round_trip_seconds += time.perf_counter() - started_at
+
+        if self.idle.qsize() < self.pool_size:
+            self.idle.put(sock)
+        else:
+            sock.close()
+        if "error" in response:
+            raise RuntimeError(f"Embedding service error: {response['error']}")
+        return response, payload
+
+    def _embed(self, op, texts):
+        if not texts:
+            return []
+        response, payload = self._request({"op": op, "texts": list(texts)})
+        return np.frombuffer(payload, dtype=np.float32).reshape(response["count"], response["dim"]).tolist()
+
+    def embed_documents(self, texts):
+        return self._embed("embed_documents", texts)
+
+    def embed_query(self, text):
+        return self._embed("embed_queries", [text])[0]
+
+    def embed_queries(self, texts):
+        return self._embed("embed_queries", texts)
+
+    def service_stats(self):
+        return self._request({"op": "stats"})[0]
+
+    def stats(self):
+        return {"round_trips": self.round_trips, "round_trip_seconds": round(self.round_trip_seconds, 3)}
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def parse_args():
+    # Defaults come from the same environment variables as the API's, so one environment
+    # configures both processes
+    parser = argparse.ArgumentParser(description="Serve query and document embeddings to the API workers of this host.")
+    parser.add_argument("--socket", default=os.getenv("EMBEDDING_SERVICE_SOCKET") or DEFAULT_SOCKET_PATH,
+                        help=f"Unix socket to listen on (default: $EMBEDDING_SERVICE_SOCKET or {DEFAULT_SOCKET_PATH})")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="Embedding model (default: all-MiniLM-L6-v2)")
+    parser.add_argument("--backend", default=os.getenv("EMBEDDING_BACKEND", "torch"),
+                        help="Embedding backend: torch, onnx or onnx-int8 (default: $EMBEDDING_BACKEND or torch)")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("EMBEDDING_THREADS", "0")),
+                        help="CPU threads for the model, 0 for the backend's default (default: $EMBEDDING_THREADS or 0)")
+    parser.add_argument("--onnx-dir", default=os.getenv("ONNX_MODEL_DIR", "../onnx_models"),
+                        help="Directory of the ONNX exports (default: $ONNX_MODEL_DIR or ../onnx_models)")
+    parser.add_argument("--cache-dir", default=os.getenv("EMBEDDING_CACHE_DIR", "../embedding_cache"),
+                        help="Persistent embedding cache directory, empty to disable "
+                             "(default: $EMBEDDING_CACHE_DIR or ../embedding_cache)")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("QUERY_BATCH_SIZE", "64")),
+                        help="Most queries per forward pass (default: $QUERY_BATCH_SIZE or 64)")
+    parser.add_argument("--batch-wait-ms", type=float, default=float(os.getenv("QUERY_BATCH_WAIT_MS", "5")),
+                        help="Longest a query waits for a batch to fill (default: $QUERY_BATCH_WAIT_MS or 5)")
+    parser.add_argument("--lru-size", type=int, default=int(os.getenv("QUERY_EMBEDDING_LRU_SIZE", "4096")),
+                        help="Recent query vectors kept in memory (default: $QUERY_EMBEDDING_LRU_SIZE or 4096)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    from embedding_cache import CachedEmbeddings
+    from hf_embeddings import embedding_cache_name, load_embeddings
+
+    args = parse_args()
+    started_at = time.perf_counter()
+    embeddings = load_embeddings(args.model, args.backend, args.threads or None, args.onnx_dir)
+    if args.cache_dir:
+        embeddings = CachedEmbeddings(embeddings, embedding_cache_name(args.model, args.backend), args.cache_dir)
+    service = EmbeddingService(embeddings, args.socket, args.batch_size, args.batch_wait_ms, args.lru_size)
+
+    # The first forward pass is paid here rather than by a worker's first query
+    service.batcher.embed_query("warm up")
+    print(f"Loaded {args.model} ({args.backend}) in {time.perf_counter() - started_at:.1f}s, "
+          f"serving embeddings on {args.socket}")
+
+    # Stopping the service (SIGTERM) shuts it down like Ctrl+C, removing its socket file
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        asyncio.run(service.serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.batcher.close()
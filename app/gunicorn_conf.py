@@ -0,0 +1,18 @@
+import os
+
+# Pre-fork deployment: gunicorn imports the app once, with the embedding model preloaded
+# (PRELOAD_EMBEDDING_MODEL), then forks the uvicorn workers from it, so the model weights stay
+# one copy-on-write copy shared by every worker instead of one copy per worker. Run from app/:
+#   gunicorn -c gunicorn_conf.py main:app
+# The model runs no forward pass before the fork (the warm-up query runs in each worker), so
+# no torch or ONNX Runtime thread pool is inherited half-initialized. Workers report their
+# rss, pss and uss on /metrics (docubot_process_memory_bytes).
+os.environ.setdefault("PRELOAD_EMBEDDING_MODEL", "1")
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+# Warm-up loads the indices in each worker after the fork, which can take a while
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
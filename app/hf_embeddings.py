@@ -0,0 +1,137 @@
+import os
+import re
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_huggingface import HuggingFaceEmbeddings
+
+# Embedding backends a deployment can pick: the sentence-transformers (PyTorch) model, or the
+# same model exported to ONNX and run by ONNX Runtime, as is or with int8 weights
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_INT8_MODEL_FILE = "model_int8.onnx"
+
+# Texts per ONNX Runtime call, and the token length texts are truncated to (the max_seq_length
+# of all-MiniLM-L6-v2 in sentence-transformers)
+DEFAULT_ONNX_BATCH_SIZE = 32
+DEFAULT_MAX_SEQ_LENGTH = 256
+
+
+class QueryBatchHuggingFaceEmbeddings(HuggingFaceEmbeddings):
+    def embed_queries(self, texts):
+        # Queries are only encoded differently from documents through query_encode_kwargs,
+        # so without those a batch of queries is a single embed_documents forward pass
+        if getattr(self, "query_encode_kwargs", None):
+            return [self.embed_query(text) for text in texts]
+        return self.embed_documents(texts)
+
+
+def _hub_model_id(model_name):
+    # sentence-transformers resolves bare model names under its own organization
+    return model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+
+
+# Export a Hugging Face model to ONNX (with optimum) next to its tokenizer, plus a copy with
+# dynamically quantized int8 weights; only needed once per model and host directory
+def export_onnx_model(model_name, model_dir):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+    from transformers import AutoTokenizer
+
+    print(f"Exporting {model_name} to ONNX in {model_dir}...")
+    model_id = _hub_model_id(model_name)
+    ORTModelForFeatureExtraction.from_pretrained(model_id, export=True).save_pretrained(model_dir)
+    AutoTokenizer.from_pretrained(model_id).save_pretrained(model_dir)
+    quantize_dynamic(
+        os.path.join(model_dir, ONNX_MODEL_FILE),
+        os.path.join(model_dir, ONNX_INT8_MODEL_FILE),
+        weight_type=QuantType.QInt8
+    )
+    print(f"Exported {model_name} to ONNX.")
+
+
+# Sentence embeddings from an ONNX export of the model, run by ONNX Runtime on the CPU. Gives the
+# same vectors as the sentence-transformers model (mean pooling over the tokens, then L2
+# normalization) up to float (or, with quantized=True, int8) rounding. Texts are sorted by
+# length before batching so each batch is padded to about the same length. The export is made
+# on first use when model_dir does not have it yet.
+class OnnxEmbeddings(Embeddings):
+    def __init__(self, model_name, model_dir, quantized=True, threads=None, batch_size=DEFAULT_ONNX_BATCH_SIZE,
+                 max_seq_length=DEFAULT_MAX_SEQ_LENGTH):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_path = os.path.join(model_dir, ONNX_INT8_MODEL_FILE if quantized else ONNX_MODEL_FILE)
+        if not os.path.exists(model_path):
+            export_onnx_model(model_name, model_dir)
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        options.inter_op_num_threads = 1
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_seq_length)
+        self.tokenizer.enable_padding()
+
+    def _embed_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        feeds = {
+            "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            "attention_mask": attention_mask,
+        }
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([encoding.type_ids for encoding in encodings], dtype=np.int64)
+        token_vectors = self.session.run(None, feeds)[0]
+        return mean_pool_normalize(token_vectors, attention_mask)
+
+    def embed_documents(self, texts):
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, vector in zip(batch, self._embed_batch([texts[i] for i in batch])):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def embed_queries(self, texts):
+        return self.embed_documents(texts)
+
+
+def mean_pool_normalize(token_vectors, attention_mask):
+    # Average the vectors of the real (unpadded) tokens and scale the result to unit length
+    weights = attention_mask[..., None].astype(np.float32)
+    pooled = (token_vectors * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+    return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+
+# The embedding model for a backend; `threads` caps the CPU threads it computes with
+def load_embeddings(model_name, backend="torch", threads=None, onnx_dir="./onnx_models"):
+    if backend == "torch":
+        if threads:
+            import torch
+
+            torch.set_num_threads(threads)
+        return QueryBatchHuggingFaceEmbeddings(model_name=model_name)
+    if backend in ("onnx", "onnx-int8"):
+        model_dir = os.path.join(onnx_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+        return OnnxEmbeddings(model_name, model_dir, quantized=backend == "onnx-int8", threads=threads)
+    raise ValueError(f"Unknown embedding backend '{backend}', expected one of: {', '.join(EMBEDDING_BACKENDS)}")
+
+
+# Name the persistent embedding cache stores a backend's vectors under: ONNX and int8 vectors
+# differ slightly from the PyTorch ones, so each backend gets its own entries
+def embedding_cache_name(model_name, backend):
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
@@ -0,0 +1,121 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+from metrics import Metrics
+
+# Default write-behind config: rows are committed once this many are pending, or once the
+# oldest pending row has waited this long, whichever comes first
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL_MS = 200.0
+
+# Attempts at committing a batch before its rows are given up on
+WRITE_ATTEMPTS = 3
+
+_STOP = object()
+
+
+# Write-behind persistence for chat history: request handlers only queue the rows in memory,
+# and a single writer thread inserts them in batched transactions, so answers never wait on a
+# commit and concurrent requests never contend for the SQLite write lock. flush() returns a
+# future that resolves once everything queued before it is committed; close() drains the queue.
+class HistoryWriter:
+    def __init__(self, session_factory, model, batch_size=DEFAULT_BATCH_SIZE,
+                 flush_interval_ms=DEFAULT_FLUSH_INTERVAL_MS, metrics=None):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self.session_factory = session_factory
+        self.model = model
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.metrics = metrics or Metrics(enabled=False)
+
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        self._start()
+
+        # A pre-forking server creates the writer before forking its workers, which inherit
+        # neither the thread nor a safe copy of its queue, so each worker starts its own
+        os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self.pending = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, **row):
+        # The timestamp is taken now, not when the row is eventually written
+        row.setdefault("timestamp", datetime.utcnow())
+        self.pending.put(row)
+
+    def flush(self):
+        future = Future()
+        self.pending.put(future)
+        return future
+
+    def close(self):
+        self.pending.put(_STOP)
+        self.thread.join()
+
+    def _run(self):
+        rows = []
+        waiters = []
+        deadline = None
+        while True:
+            timeout = None if not rows else max(deadline - time.monotonic(), 0)
+            try:
+                item = self.pending.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._write(rows)
+                for waiter in waiters:
+                    waiter.set_result(None)
+                return
+            if isinstance(item, Future):
+                waiters.append(item)
+            elif item is not None:
+                rows.append(item)
+                if len(rows) == 1:
+                    deadline = time.monotonic() + self.flush_interval
+
+            # Write on the interval, on a full batch, or right away when someone waits for it
+            if item is None or waiters or len(rows) >= self.batch_size:
+                self._write(rows)
+                rows = []
+                for waiter in waiters:
+                    waiter.set_result(None)
+                waiters = []
+
+    def _write(self, rows):
+        if not rows:
+            return
+        for attempt in range(WRITE_ATTEMPTS):
+            session = self.session_factory()
+            try:
+                with self.metrics.timer("history_write"):
+                    session.bulk_insert_mappings(self.model, rows)
+                    session.commit()
+                self.written += len(rows)
+                self.batches += 1
+                return
+            except Exception as e:
+                session.rollback()
+                print(f"Failed to write {len(rows)} chat history rows (attempt {attempt + 1}): {e}")
+                time.sleep(0.1 * (2 ** attempt))
+            finally:
+                session.close()
+        self.failed += len(rows)
+
+    def stats(self):
+        return {
+            "written": self.written,
+            "batches": self.batches,
+            "failed": self.failed,
+            "pending": self.pending.qsize(),
+        }
@@ -0,0 +1,98 @@
+import fcntl
+import json
+import os
+import re
+from contextlib import contextmanager
+
+# Shared state of the indexed collections, kept next to the Chroma database so that the loaders
+# and the API agree on it: each collection's generation is bumped whenever a loader changes it.
+# A rebuild (ingest --rebuild) writes a new version of a collection into its own Chroma
+# collection, named like FastAPI__v3, and swaps it in by recording it as the collection's
+# "active" one; without a rebuild, the collection of the plain name is served.
+
+VERSION_SEPARATOR = "__v"
+
+
+def index_state_path(db_path):
+    return os.path.join(db_path, "index_state.json")
+
+
+def read_index_state(db_path):
+    path = index_state_path(db_path)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def write_index_state(db_path, state):
+    # Write to a temporary file first so readers never see a torn file
+    path = index_state_path(db_path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(state, file, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def locked_index_state(db_path):
+    # Read, modify and write the state under an exclusive lock, so loaders running at the same
+    # time never lose each other's updates; nothing is written if the block raises
+    os.makedirs(db_path, exist_ok=True)
+    with open(os.path.join(db_path, "index_state.lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        state = read_index_state(db_path)
+        yield state
+        write_index_state(db_path, state)
+
+
+def bump_generation(db_path, collection_name):
+    with locked_index_state(db_path) as state:
+        entry = state.setdefault(collection_name, {})
+        entry["generation"] = entry.get("generation", 0) + 1
+    return entry["generation"]
+
+
+def versioned_collection_name(collection_name, version):
+    return f"{collection_name}{VERSION_SEPARATOR}{version}"
+
+
+def logical_collection_name(collection_name):
+    # FastAPI for FastAPI__v3, and for FastAPI itself
+    return re.sub(rf"{re.escape(VERSION_SEPARATOR)}\d+$", "", collection_name)
+
+
+def collection_version(collection_name, candidate):
+    # Version of `candidate` as a version of collection_name: 0 for the collection of the plain
+    # name, None when it is some other collection
+    if candidate == collection_name:
+        return 0
+    match = re.fullmatch(rf"{re.escape(collection_name + VERSION_SEPARATOR)}(\d+)", candidate)
+    return int(match.group(1)) if match else None
+
+
+def active_collection_name(state, collection_name):
+    # The Chroma collection currently serving a collection
+    return state.get(collection_name, {}).get("active", collection_name)
+
+
+def reserve_version(db_path, collection_name):
+    # Next version number of a collection; never handed out twice, even to an aborted rebuild
+    with locked_index_state(db_path) as state:
+        entry = state.setdefault(collection_name, {})
+        version = entry.get("next_version", 1)
+        entry["next_version"] = version + 1
+    return version
+
+
+def activate_collection(db_path, collection_name, version_name):
+    # Serve collection_name from version_name and bump its generation in one atomic write, so
+    # the API never sees the new version under the old generation; returns the version served
+    # before (recorded as "previous") and the new generation
+    with locked_index_state(db_path) as state:
+        entry = state.setdefault(collection_name, {})
+        previous = entry.get("active", collection_name)
+        entry["active"] = version_name
+        entry["previous"] = previous
+        entry["generation"] = entry.get("generation", 0) + 1
+    return previous, entry["generation"]
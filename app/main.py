@@ -1,26 +1,128 @@
+import time
+
+# Taken first thing so the reported import-to-ready time covers the whole app import
+IMPORT_STARTED_AT = time.perf_counter()
+
 import os
+import gc
+import asyncio
 import jwt  # This is from PyJWT
-from fastapi import FastAPI, Depends, HTTPException, status
+import json
+import base64
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, status
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy import Column, Integer, String, ForeignKey, create_engine
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, and_, or_, create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session, relationship
 from passlib.context import CryptContext
 from pydantic import BaseModel, EmailStr
-from typing import Optional
-from datetime import datetime, timedelta
-from openai import OpenAI
+from typing import List, Optional
+from datetime import datetime, timedelta, timezone
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, nullcontext
+from functools import partial
+from openai import AsyncOpenAI, APITimeoutError
 import secrets
 
+from answer_cache import AnswerCache, normalize_question
 from chroma_db import ChromaDBHandler
+from context_builder import ContextBuilder, Tokenizer
+from history_writer import HistoryWriter
+from metrics import Metrics, process_memory
+from profiler import SlowRequestProfiler
+
+# Database setup; DATABASE_URL and CHROMA_DB_PATH point the API at other data (e.g. for benchmarks)
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
+CHROMA_DB_PATH = os.getenv("CHROMA_DB_PATH", "../chroma_db")
+
+# Persistent embedding cache directory; set EMBEDDING_CACHE_DIR to an empty string to disable it
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "../embedding_cache") or None
 
-# Database setup
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
+
+# WAL lets readers run alongside the history writer, and synchronous=NORMAL drops the fsync
+# from every commit (a crash can lose the last commits, never corrupt the database). Other
+# databases set through DATABASE_URL are left to their own settings.
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.execute("PRAGMA cache_size=-16000")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", set_sqlite_pragmas)
+
+# Workers forked by a pre-forking server must not share the parent's pooled connections
+os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
-chroma_db_handler = ChromaDBHandler()
+# Metrics config: per-stage latency histograms and token counts are recorded for /metrics;
+# METRICS_ENABLED=0 turns the per-request recording off (the cache stats are still served)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+metrics = Metrics(enabled=METRICS_ENABLED)
+
+# Slow request profiling, off unless PROFILE_SLOW_REQUESTS_MS is set: PROFILE_SAMPLE_RATE of the
+# requests are sampled, and those slower than the threshold leave a profile in PROFILE_DIR
+PROFILE_SLOW_REQUESTS_MS = float(os.getenv("PROFILE_SLOW_REQUESTS_MS", "0"))
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "1.0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "../profiles")
+
+profiler = None
+if PROFILE_SLOW_REQUESTS_MS > 0:
+    profiler = SlowRequestProfiler(
+        PROFILE_SLOW_REQUESTS_MS,
+        PROFILE_DIR,
+        interval_ms=PROFILE_INTERVAL_MS,
+        sample_rate=PROFILE_SAMPLE_RATE
+    )
+
+# Embedding backend config: EMBEDDING_BACKEND is torch (sentence-transformers), onnx or onnx-int8
+# (ONNX Runtime, exported to ONNX_MODEL_DIR on first use), with EMBEDDING_THREADS CPU threads
+# (0 leaves it to the backend). Compare the backends with benchmarks/embedding_backends.py first.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0")) or None
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "../onnx_models")
+
+# Query embedding batching config: concurrent questions are embedded together in batches of
+# up to QUERY_BATCH_SIZE, waiting at most QUERY_BATCH_WAIT_MS for a batch to fill
+QUERY_BATCH_SIZE = int(os.getenv("QUERY_BATCH_SIZE", "64"))
+QUERY_BATCH_WAIT_MS = float(os.getenv("QUERY_BATCH_WAIT_MS", "5"))
+QUERY_EMBEDDING_LRU_SIZE = int(os.getenv("QUERY_EMBEDDING_LRU_SIZE", "4096"))
+
+# Embedding deployment for multi-worker servers, where every worker otherwise holds its own copy
+# of the model: with EMBEDDING_SERVICE_SOCKET set, workers send their queries to the embedding
+# service (python embedding_service.py) on that Unix socket and load no model at all; with
+# PRELOAD_EMBEDDING_MODEL=1 the model is loaded at import instead, so a pre-forking server
+# (gunicorn -c gunicorn_conf.py main:app) loads it once and its workers share it copy-on-write
+EMBEDDING_SERVICE_SOCKET = os.getenv("EMBEDDING_SERVICE_SOCKET", "") or None
+PRELOAD_EMBEDDING_MODEL = os.getenv("PRELOAD_EMBEDDING_MODEL", "0") == "1"
+
+chroma_db_handler = ChromaDBHandler(
+    db_path=CHROMA_DB_PATH,
+    cache_dir=EMBEDDING_CACHE_DIR,
+    query_batch_size=QUERY_BATCH_SIZE,
+    query_batch_wait_ms=QUERY_BATCH_WAIT_MS,
+    query_lru_size=QUERY_EMBEDDING_LRU_SIZE,
+    metrics=metrics,
+    embedding_backend=EMBEDDING_BACKEND,
+    embedding_threads=EMBEDDING_THREADS,
+    onnx_dir=ONNX_MODEL_DIR,
+    embedding_service=EMBEDDING_SERVICE_SOCKET
+)
+
+if PRELOAD_EMBEDDING_MODEL and not EMBEDDING_SERVICE_SOCKET:
+    chroma_db_handler.preload_model()
+    # Objects alive now are left out of garbage collection from here on, so the collector never
+    # writes to (and un-shares) the pages of the preloaded model in the forked workers
+    gc.freeze()
 
 # Models
 class User(Base):
@@ -39,11 +141,29 @@ class ChatHistory(Base):
     framework = Column(String)
     question = Column(String)
     answer = Column(String)
-    timestamp = Column(String, default=str(datetime.utcnow()))
+    timestamp = Column(DateTime, default=datetime.utcnow, nullable=False)
     user = relationship("User", back_populates="chat_history")
 
+    # Serves the per-user, per-framework history pages newest first (see migrate_chat_history.py)
+    __table_args__ = (
+        Index("ix_chat_history_user_framework_timestamp", "user_id", "framework", "timestamp", "id"),
+    )
+
 Base.metadata.create_all(bind=engine)
 
+# Chat history is written behind the responses, in batches of up to HISTORY_BATCH_SIZE rows
+# committed at least every HISTORY_FLUSH_INTERVAL_MS
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", "100"))
+HISTORY_FLUSH_INTERVAL_MS = float(os.getenv("HISTORY_FLUSH_INTERVAL_MS", "200"))
+
+history_writer = HistoryWriter(
+    SessionLocal,
+    ChatHistory,
+    batch_size=HISTORY_BATCH_SIZE,
+    flush_interval_ms=HISTORY_FLUSH_INTERVAL_MS,
+    metrics=metrics
+)
+
 # Pydantic models
 class UserCreate(BaseModel):
     email: EmailStr
@@ -55,11 +175,21 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     email: Optional[str] = None
+    user_id: Optional[int] = None
 
 class QueryRequest(BaseModel):
     framework: str
     question: str
 
+class BatchQueryItem(BaseModel):
+    id: Optional[str] = None
+    framework: str
+    question: str
+
+class BatchQueryRequest(BaseModel):
+    items: List[BatchQueryItem]
+    save_history: bool = False
+
 # Security & JWT config
 SECRET_KEY = "supersecretkey"  # This should be kept safe
 ALGORITHM = "HS256"
@@ -68,11 +198,124 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY", None))
+# bcrypt is deliberately slow, so hashing and verification run in their own bounded pool off the
+# event loop; a login storm then queues up there instead of stalling /query traffic
+AUTH_MAX_WORKERS = int(os.getenv("AUTH_MAX_WORKERS", "2"))
+auth_executor = ThreadPoolExecutor(max_workers=AUTH_MAX_WORKERS, thread_name_prefix="password-hash")
+
+# Decoded token principals are cached until the token expires, so authenticated requests skip
+# the JWT decode and the user lookup; at most AUTH_TOKEN_CACHE_SIZE tokens are kept
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+principal_cache = OrderedDict()
+
+# LLM and vector search concurrency config
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+SEARCH_MAX_WORKERS = int(os.getenv("SEARCH_MAX_WORKERS", "4"))
+
+# Retrieval config: RETRIEVAL_TOP_K chunks are sent to the LLM; with HYBRID_SEARCH on, they are
+# fused from the top HYBRID_CANDIDATES vector and BM25 results of the framework
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "5"))
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+
+# Context packing config: overlapping chunks are merged, duplicates dropped, and the rest packed
+# into CONTEXT_TOKEN_BUDGET tokens of the CONTEXT_TOKENIZER encoding (the one gpt-4o-mini uses)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "o200k_base")
+
+context_builder = ContextBuilder(token_budget=CONTEXT_TOKEN_BUDGET, tokenizer=Tokenizer(CONTEXT_TOKENIZER))
+
+# Initialize the async OpenAI client; at most LLM_MAX_CONCURRENCY completions are in flight per worker
+client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY", None), timeout=LLM_TIMEOUT_SECONDS)
+llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+# Batch config: at most BATCH_MAX_ITEMS questions per /query/batch request, of which at most
+# BATCH_LLM_CONCURRENCY wait on the LLM at once, so a batch cannot take all of LLM_MAX_CONCURRENCY
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+
+# Answer cache config: answers are reused for the same normalized question, or for a question
+# whose embedding is at least ANSWER_CACHE_SIMILARITY similar, until the framework is reindexed
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(6 * 60 * 60)))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+answer_cache = AnswerCache(
+    max_entries=ANSWER_CACHE_SIZE,
+    ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+    similarity_threshold=ANSWER_CACHE_SIMILARITY
+)
+
+# Embedding and Chroma search are blocking, so they run in a bounded pool off the event loop
+search_executor = ThreadPoolExecutor(max_workers=SEARCH_MAX_WORKERS, thread_name_prefix="vector-search")
+
+# Load the embedding model and open every framework's index in the background at startup,
+# instead of on the first queries; set WARM_UP=0 to only load them on demand
+WARM_UP = os.getenv("WARM_UP", "1") == "1"
+
+startup_state = {"ready": False, "import_to_accept_seconds": None, "import_to_ready_seconds": None, "warm_up_error": None}
+
+def mark_ready():
+    startup_state["ready"] = True
+    startup_state["import_to_ready_seconds"] = round(time.perf_counter() - IMPORT_STARTED_AT, 3)
+    print(f"Ready {startup_state['import_to_ready_seconds']}s after import")
+
+async def warm_up():
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(search_executor, chroma_db_handler.warm_up)
+        await loop.run_in_executor(search_executor, context_builder.tokenizer.count, "warm up")
+    except Exception as e:
+        # Warm-up is best effort: the indices still load on demand
+        startup_state["warm_up_error"] = str(e)
+        print(f"Warm-up failed: {e}")
+    mark_ready()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup_state["import_to_accept_seconds"] = round(time.perf_counter() - IMPORT_STARTED_AT, 3)
+    print(f"Accepting connections {startup_state['import_to_accept_seconds']}s after import")
+    warm_up_task = None
+    if WARM_UP:
+        warm_up_task = asyncio.create_task(warm_up())
+    else:
+        mark_ready()
+    yield
+    if warm_up_task is not None:
+        await warm_up_task
+    search_executor.shutdown(wait=True)
+    auth_executor.shutdown(wait=True)
+    chroma_db_handler.close()
+
+    # Drain the queued chat history before exiting
+    await asyncio.to_thread(history_writer.close)
+    await client.close()
 
 # Initialize FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+# Time every request by route, and profile it when slow request profiling is on. Without
+# either, the middleware is not installed at all. Streaming responses are timed until their
+# first byte; the LLM stages inside them are recorded separately.
+async def record_request(request: Request, call_next):
+    session = profiler.start() if profiler is not None else None
+    started_at = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        seconds = time.perf_counter() - started_at
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "other"
+        metrics.observe_request(request.method, route_path, status_code, seconds)
+        if session is not None:
+            profiler.stop(session, seconds, f"{request.method} {route_path}")
+
+if METRICS_ENABLED or profiler is not None:
+    app.middleware("http")(record_request)
 
 # Dependency for database session
 def get_db():
@@ -89,9 +332,23 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
-def authenticate_user(db: Session, email: str, password: str):
+# Async variants that run bcrypt in the auth pool
+async def verify_password_async(plain_password, hashed_password):
+    loop = asyncio.get_running_loop()
+    with metrics.timer("password_verify"):
+        return await loop.run_in_executor(auth_executor, verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    loop = asyncio.get_running_loop()
+    with metrics.timer("password_hash"):
+        return await loop.run_in_executor(auth_executor, get_password_hash, password)
+
+async def authenticate_user(db: Session, email: str, password: str):
     user = db.query(User).filter(User.email == email).first()
-    if not user or not verify_password(password, user.hashed_password):
+
+    # Hand the pooled connection back while bcrypt runs, so a login storm never exhausts the pool
+    db.close()
+    if not user or not await verify_password_async(password, user.hashed_password):
         return False
     return user
 
@@ -108,22 +365,22 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 # User registration
 @app.post("/register/", response_model=Token)
 async def register_user(user: UserCreate, db: Session = Depends(get_db)):
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     db_user = User(email=user.email, hashed_password=hashed_password)
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
-    access_token = create_access_token(data={"sub": db_user.email})
+    access_token = create_access_token(data={"sub": db_user.email, "uid": db_user.id})
     return {"access_token": access_token, "token_type": "bearer"}
 
 # User login
 @app.post("/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(data={"sub": user.email}, expires_delta=access_token_expires)
+    access_token = create_access_token(data={"sub": user.email, "uid": user.id}, expires_delta=access_token_expires)
     return {"access_token": access_token, "token_type": "bearer"}
 
 # Forgot password
@@ -145,14 +402,17 @@ async def forgot_password(email: EmailStr, db: Session = Depends(get_db)):
 # Reset password
 @app.post("/reset-password/")
 async def reset_password(token: str, new_password: str, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.reset_token == token).first()
-    if not user:
-        raise HTTPException(status_code=400, detail="Invalid or expired token")
-
-    # Update password
-    user.hashed_password = get_password_hash(new_password)
-    user.reset_token = None  # Clear the reset token
+    # Hash before touching the database, so no transaction is open while bcrypt runs
+    hashed_password = await get_password_hash_async(new_password)
+
+    # Check the token, update the password and clear the token in one statement, so a token
+    # can only ever be used once, even by concurrent requests
+    updated = db.query(User).filter(User.reset_token == token).update(
+        {User.hashed_password: hashed_password, User.reset_token: None}, synchronize_session=False
+    )
     db.commit()
+    if not updated:
+        raise HTTPException(status_code=400, detail="Invalid or expired token")
     return {"msg": "Password updated successfully"}
 
 # Helper function to simulate sending a password reset email
@@ -160,88 +420,407 @@ def send_reset_email(email: str, reset_token: str):
     reset_link = f"http://localhost:8000/reset-password?token={reset_token}"
     print(f"Sending reset link to {email}: {reset_link}")
 
-# Chatbot query endpoint with history logging
-@app.post("/query")
-async def query_docs(request: QueryRequest, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    # Authenticate the user
+# Embed the question through the query batcher, which coalesces concurrent questions
+async def embed_question(question):
+    with metrics.timer("embed"):
+        return await asyncio.wrap_future(chroma_db_handler.submit_query(question))
+
+# Run the (blocking) vector and BM25 search in the bounded search pool; the "search" stage
+# includes the wait for a pool thread, the handler records the searches themselves
+async def search_docs(framework, question, query_vector, k=RETRIEVAL_TOP_K):
+    loop = asyncio.get_running_loop()
+    with metrics.timer("search"):
+        return await loop.run_in_executor(search_executor, partial(
+            chroma_db_handler.search, framework, question, query_vector,
+            k=k, candidates=HYBRID_CANDIDATES, hybrid=HYBRID_SEARCH
+        ))
+
+# Construct the messages for chat completion with retrieved context
+def build_messages(framework, question, context):
+    return [
+        {"role": "system", "content": f"You are a helpful assistant for answering questions about the framework {framework}."},
+        {"role": "assistant", "content": f"Context:\n{context}"},
+        {"role": "user", "content": f"Question: {question}"}
+    ]
+
+# Generate an answer with gpt-4o-mini without blocking the event loop
+async def generate_answer(messages):
+    try:
+        with metrics.timer("llm_wait"):
+            await llm_semaphore.acquire()
+        try:
+            with metrics.timer("llm"):
+                response = await client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=messages,
+                    max_tokens=1000,
+                    temperature=0.7
+                )
+        finally:
+            llm_semaphore.release()
+        if response.usage is not None:
+            metrics.observe_tokens("completion", response.usage.completion_tokens)
+        return response.choices[0].message.content.strip()
+    except APITimeoutError:
+        raise HTTPException(status_code=504, detail="Timed out generating response")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating response: {str(e)}")
+
+# Look up the id of a user, for tokens issued before they carried a uid claim
+def get_user_id(email: str):
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == email).first()
+        return user.id if user else None
+    finally:
+        db.close()
+
+# Shared auth dependency: the principal (user id, email) behind a bearer token. Principals are
+# cached per token until it expires, and come from the token's claims instead of a user SELECT.
+async def get_current_principal(token: str = Depends(oauth2_scheme)) -> TokenData:
+    with metrics.timer("auth"):
+        return await resolve_principal(token)
+
+async def resolve_principal(token):
+    now = datetime.now(timezone.utc).timestamp()
+    cached = principal_cache.get(token)
+    if cached is not None:
+        principal, expires_at = cached
+        if expires_at > now:
+            principal_cache.move_to_end(token)
+            metrics.count("principal_cache_hit")
+            return principal
+        del principal_cache[token]
+        raise HTTPException(status_code=401, detail="Token has expired")
+    metrics.count("principal_cache_miss")
+
     credentials_exception = HTTPException(status_code=401, detail="Could not validate credentials")
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
-        token_data = TokenData(email=email)
+        principal = TokenData(email=email, user_id=payload.get("uid"))
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    user = db.query(User).filter(User.email == token_data.email).first()
-    if not user:
-        raise credentials_exception
+    if principal.user_id is None:
+        principal.user_id = await asyncio.to_thread(get_user_id, email)
+        if principal.user_id is None:
+            raise credentials_exception
+
+    principal_cache[token] = (principal, payload["exp"])
+    while len(principal_cache) > AUTH_TOKEN_CACHE_SIZE:
+        principal_cache.popitem(last=False)
+    return principal
 
+# Check the framework and make sure its ChromaDB index is open
+async def load_framework(framework):
     # Check if the requested framework exists (assuming `chroma_db_handler` is defined)
-    retriever = chroma_db_handler.get_index(request.framework)
-    if retriever is None:
+    if framework not in chroma_db_handler.frameworks:
         raise HTTPException(status_code=400, detail="Unsupported framework")
 
-    # Retrieve relevant documents from ChromaDB
-    docs = retriever.similarity_search(request.question, k=5)
-    print(f"Found {len(docs)} for context.")
-    context = "\n".join([doc.page_content for doc in docs])
-
-    # Construct the messages for chat completion with retrieved context
-    messages = [
-        {"role": "system", "content": f"You are a helpful assistant for answering questions about the framework {request.framework}."},
-        {"role": "assistant", "content": f"Context:\n{context}"},
-        {"role": "user", "content": f"Question: {request.question}"}
-    ]
+    # An index that is not loaded yet (nor the embedding model behind it) is opened off the event loop
+    if framework not in chroma_db_handler.indices:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(search_executor, chroma_db_handler.get_index, framework)
+
+# Retrieve the context for an embedded question from the framework's ChromaDB collection,
+# packed into the context token budget
+async def retrieve_context(framework, question, query_vector):
+    docs = await search_docs(framework, question, query_vector)
+    loop = asyncio.get_running_loop()
+    with metrics.timer("context_pack"):
+        context, stats = await loop.run_in_executor(search_executor, context_builder.build, docs)
+    metrics.observe_tokens("retrieved", stats["retrieved_tokens"])
+    metrics.observe_tokens("context", stats["context_tokens"])
+    print(f"Context: {stats['chunks']} chunks -> {stats['packed_passages']} of {stats['passages']} passages, "
+          f"{stats['context_tokens']} tokens (retrieved {stats['retrieved_tokens']}, budget {stats['token_budget']})")
+    return context
+
+# Log the tokens sent to the LLM for a request
+def log_prompt_tokens(messages):
+    tokens = sum(context_builder.tokenizer.count(message["content"]) for message in messages)
+    metrics.observe_tokens("prompt", tokens)
+    print(f"Prompt: {tokens} tokens")
+
+# Answer an embedded question from the answer cache, or else from its retrieved context;
+# `llm_limit` optionally bounds the LLM calls of a group of questions. Returns the answer and
+# whether it came from the cache.
+async def answer_question(framework, question, query_vector, llm_limit=None):
+    generation = chroma_db_handler.get_generation(framework)
+    with metrics.timer("answer_cache_lookup"):
+        answer = answer_cache.lookup(framework, question, query_vector, generation)
+    if answer is not None:
+        return answer, True
+
+    context = await retrieve_context(framework, question, query_vector)
 
     # Generate the final answer using OpenAI's 4o mini
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            max_tokens=1000,
-            temperature=0.7
-        )
-        answer = response.choices[0].message.content.strip()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error generating response: {str(e)}")
+    messages = build_messages(framework, question, context)
+    log_prompt_tokens(messages)
+    async with llm_limit or nullcontext():
+        answer = await generate_answer(messages)
+    answer_cache.store(framework, question, query_vector, answer, generation)
+    return answer, False
 
-    # Store the interaction in chat history, including the framework
-    chat_history = ChatHistory(user_id=user.id, framework=request.framework, question=request.question, answer=answer)
-    db.add(chat_history)
-    db.commit()
+# Chatbot query endpoint with history logging
+@app.post("/query")
+async def query_docs(request: QueryRequest, principal: TokenData = Depends(get_current_principal)):
+    await load_framework(request.framework)
+
+    # The query embedding serves both the answer cache lookup and the vector search
+    query_vector = await embed_question(request.question)
+    answer, _ = await answer_question(request.framework, request.question, query_vector)
+
+    # Store the interaction in chat history, including the framework (written behind the response)
+    history_writer.submit(user_id=principal.user_id, framework=request.framework, question=request.question, answer=answer)
 
     return {"answer": answer}
 
 
-# View chat history for logged in user
-@app.get("/history/")
-async def get_chat_history(framework: str, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(status_code=401, detail="Could not validate credentials")
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-        token_data = TokenData(email=email)
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token has expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+# Batch variant of /query for many questions at once (regression runs, FAQ generation). All
+# questions are embedded together through the query batcher, their searches run in parallel,
+# and their LLM calls at most BATCH_LLM_CONCURRENCY at a time. Results are streamed back as
+# JSON lines in completion order, each with the index (and id, if given) of its question.
+# Answers only go to the chat history with save_history.
+@app.post("/query/batch")
+async def query_docs_batch(request: BatchQueryRequest, principal: TokenData = Depends(get_current_principal)):
+    if len(request.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"A batch holds at most {BATCH_MAX_ITEMS} questions")
 
-    user = db.query(User).filter(User.email == token_data.email).first()
-    if not user:
-        raise credentials_exception
+    supported = [
+        (index, item) for index, item in enumerate(request.items) if item.framework in chroma_db_handler.frameworks
+    ]
+    for framework in {item.framework for _, item in supported}:
+        await load_framework(framework)
+    query_vectors = await asyncio.gather(*[embed_question(item.question) for _, item in supported])
+
+    # Questions repeated within the batch are answered once
+    llm_limit = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+    answers = {}
+    for (_, item), query_vector in zip(supported, query_vectors):
+        key = (item.framework, normalize_question(item.question))
+        if key not in answers:
+            answers[key] = asyncio.create_task(answer_question(item.framework, item.question, query_vector, llm_limit))
+
+    async def answer_item(index, item):
+        result = {"index": index, "id": item.id, "framework": item.framework, "question": item.question}
+        if item.framework not in chroma_db_handler.frameworks:
+            result["error"] = "Unsupported framework"
+            return result
+        try:
+            answer, cached = await answers[(item.framework, normalize_question(item.question))]
+        except HTTPException as e:
+            result["error"] = e.detail
+            return result
+        except Exception as e:
+            # One failed question does not end the batch
+            result["error"] = str(e)
+            return result
+        result.update(answer=answer, cached=cached)
+        if request.save_history:
+            history_writer.submit(user_id=principal.user_id, framework=item.framework, question=item.question, answer=answer)
+        return result
+
+    async def result_stream():
+        tasks = [asyncio.create_task(answer_item(index, item)) for index, item in enumerate(request.items)]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield json.dumps(await task) + "\n"
+        finally:
+            # The client went away (or the batch is done): stop whatever is still running
+            for task in [*tasks, *answers.values()]:
+                task.cancel()
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+
+# Format one server-sent event
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Streaming variant of /query: answer tokens are sent as server-sent events as soon as the
+# LLM produces them, and the complete answer is stored in the chat history at the end
+@app.post("/query/stream")
+async def query_docs_stream(request: QueryRequest, principal: TokenData = Depends(get_current_principal)):
+    user_id = principal.user_id
+
+    await load_framework(request.framework)
+    query_vector = await embed_question(request.question)
+    generation = chroma_db_handler.get_generation(request.framework)
+    with metrics.timer("answer_cache_lookup"):
+        cached_answer = answer_cache.lookup(request.framework, request.question, query_vector, generation)
+
+    messages = None
+    if cached_answer is None:
+        context = await retrieve_context(request.framework, request.question, query_vector)
+        messages = build_messages(request.framework, request.question, context)
+        log_prompt_tokens(messages)
+
+    async def event_stream():
+        parts = []
+        if cached_answer is not None:
+            # A cached answer is sent as a single token event
+            parts.append(cached_answer)
+            yield sse_event("token", {"token": cached_answer})
+        else:
+            try:
+                started_at = time.perf_counter()
+                async with llm_semaphore:
+                    metrics.observe_stage("llm_wait", time.perf_counter() - started_at)
+                    started_at = time.perf_counter()
+                    stream = await client.chat.completions.create(
+                        model="gpt-4o-mini",
+                        messages=messages,
+                        max_tokens=1000,
+                        temperature=0.7,
+                        stream=True
+                    )
+                    async for chunk in stream:
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            if not parts:
+                                metrics.observe_stage("llm_first_token", time.perf_counter() - started_at)
+                            parts.append(chunk.choices[0].delta.content)
+                            yield sse_event("token", {"token": chunk.choices[0].delta.content})
+                metrics.observe_stage("llm", time.perf_counter() - started_at)
+
+                # Every streamed delta carries one token
+                metrics.observe_tokens("completion", len(parts))
+            except Exception as e:
+                yield sse_event("error", {"detail": f"Error generating response: {str(e)}"})
+                return
+
+        answer = "".join(parts).strip()
+        if cached_answer is None:
+            answer_cache.store(request.framework, request.question, query_vector, answer, generation)
+
+        history_writer.submit(user_id=user_id, framework=request.framework, question=request.question, answer=answer)
+
+        yield sse_event("done", {"answer": answer})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+# Answer cache hit and miss counts, query embedding batching and history writer stats
+@app.get("/cache/stats")
+async def get_cache_stats():
+    return {
+        **answer_cache.stats(),
+        "query_embeddings": chroma_db_handler.query_embedding_stats(),
+        "history_writer": history_writer.stats()
+    }
+
+
+# Stats the app keeps anyway (caches, batching, history writer, startup), read at scrape time
+def collect_app_stats():
+    cache = answer_cache.stats()
+    yield ("answer_cache_lookups_total", "counter", "Answer cache lookups by result", [
+        ({"result": "exact_hit"}, cache["exact_hits"]),
+        ({"result": "semantic_hit"}, cache["semantic_hits"]),
+        ({"result": "miss"}, cache["misses"]),
+    ])
+    yield ("answer_cache_hit_ratio", "gauge", "Share of answer cache lookups served from the cache",
+           [({}, cache["hit_rate"])])
+    yield ("answer_cache_entries", "gauge", "Cached answers per framework",
+           [({"framework": framework}, entries) for framework, entries in cache["entries"].items()])
+
+    embeddings = chroma_db_handler.query_embedding_stats()
+    if embeddings:
+        yield ("query_embedding_lru_hits_total", "counter", "Query embeddings served from the in-memory LRU",
+               [({}, embeddings["lru_hits"])])
+        yield ("query_embedding_batches_total", "counter", "Batched query embedding forward passes",
+               [({}, embeddings["batches"])])
+        yield ("query_embeddings_total", "counter", "Queries embedded by the model", [({}, embeddings["batched_queries"])])
+        yield ("query_embedding_seconds_total", "counter", "Seconds spent embedding query batches",
+               [({}, embeddings["embed_seconds"])])
+    if "service" in embeddings:
+        yield ("embedding_service_round_trips_total", "counter", "Requests sent to the embedding service",
+               [({}, embeddings["service"]["round_trips"])])
+        yield ("embedding_service_seconds_total", "counter", "Seconds spent in round trips to the embedding service",
+               [({}, embeddings["service"]["round_trip_seconds"])])
+
+    yield ("process_memory_bytes", "gauge", "Memory of this worker: resident (rss), proportional (pss) and private (uss)",
+           [({"kind": kind}, value) for kind, value in process_memory().items()])
+    yield ("embedding_mode", "gauge", "How this worker embeds queries: in_process, preloaded or service",
+           [({"mode": chroma_db_handler.embedding_mode()}, 1)])
+
+    writer = history_writer.stats()
+    yield ("history_rows_written_total", "counter", "Chat history rows committed", [({}, writer["written"])])
+    yield ("history_rows_failed_total", "counter", "Chat history rows given up on", [({}, writer["failed"])])
+    yield ("history_batches_total", "counter", "Chat history batches committed", [({}, writer["batches"])])
+    yield ("history_pending", "gauge", "Chat history rows and flushes queued", [({}, writer["pending"])])
+
+    yield ("principal_cache_entries", "gauge", "Token principals cached", [({}, len(principal_cache))])
+    yield ("ready", "gauge", "Whether the startup warm-up has completed", [({}, int(startup_state["ready"]))])
+    yield ("load_seconds", "gauge", "Seconds each component took to load", [
+        ({"component": component}, seconds) for component, seconds in chroma_db_handler.status()["load_seconds"].items()
+    ])
+
+metrics.add_collector(collect_app_stats)
+
+# Prometheus scrape endpoint: stage latency histograms, request latency by route, tokens per LLM
+# request and the cache, batching and history writer stats
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+# Readiness probe: 503 until the startup warm-up has loaded the model and indices
+@app.get("/ready")
+async def readiness():
+    body = {**startup_state, **chroma_db_handler.status()}
+    if not startup_state["ready"]:
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+
+# History page size config
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "20"))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "100"))
+
+# History cursors are the (timestamp, id) of the last entry of a page, opaque to clients
+def encode_history_cursor(entry):
+    raw = json.dumps([entry.timestamp.isoformat(), entry.id])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_history_cursor(cursor):
+    try:
+        timestamp, entry_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(timestamp), int(entry_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# View chat history for logged in user, newest first, one page at a time. Pages are fetched by
+# keyset on (timestamp, id) through the composite index, so every page costs the same however
+# long the history is; pass the returned next_cursor to get the following page.
+@app.get("/history/")
+async def get_chat_history(framework: str, cursor: Optional[str] = None,
+                           limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+                           principal: TokenData = Depends(get_current_principal), db: Session = Depends(get_db)):
+    # Commit the queued history first so users always see their latest answers
+    with metrics.timer("history_flush"):
+        await asyncio.wrap_future(history_writer.flush())
 
     # Filter the chat history by both user ID and framework
-    history = db.query(ChatHistory).filter(ChatHistory.user_id == user.id, ChatHistory.framework == framework).order_by(ChatHistory.timestamp.desc()).all()
+    query = db.query(ChatHistory).filter(ChatHistory.user_id == principal.user_id, ChatHistory.framework == framework)
+    if cursor is not None:
+        timestamp, entry_id = decode_history_cursor(cursor)
+        query = query.filter(or_(
+            ChatHistory.timestamp < timestamp,
+            and_(ChatHistory.timestamp == timestamp, ChatHistory.id < entry_id)
+        ))
+
+    # One extra row tells whether there is a next page
+    history = query.order_by(ChatHistory.timestamp.desc(), ChatHistory.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_history_cursor(history[limit - 1]) if len(history) > limit else None
 
     return {
         "history": [
-            {"question": h.question, "answer": h.answer, "timestamp": h.timestamp}
-            for h in history
-        ]
+            {"question": h.question, "answer": h.answer, "timestamp": h.timestamp.isoformat()}
+            for h in history[:limit]
+        ],
+        "next_cursor": next_cursor
     }
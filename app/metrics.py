@@ -0,0 +1,195 @@
+import bisect
+import threading
+import time
+
+# Histogram buckets: seconds for stage latencies, counts for tokens
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+# Cumulative histogram in the Prometheus sense; each observation takes one bisect and a lock
+class Histogram:
+    def __init__(self, name, help_text, label_names=(), buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for labels, (counts, total) in sorted(self.series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    bucket_labels = _format_labels(self.label_names, labels, ("le", _format_value(bound)))
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                label_text = _format_labels(self.label_names, labels)
+                lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+                lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started_at")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started_at, self.labels)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_TIMER = _NullTimer()
+
+
+# Memory of a process in bytes, from Linux's /proc/<pid>/smaps_rollup: rss counts every resident
+# page, pss splits the shared ones between the processes sharing them, and uss is the private
+# pages only (what exiting the process would free). Model weights shared copy-on-write with
+# forked workers, or held by the embedding service, count fully in rss but not in uss. Empty
+# where smaps_rollup is not available.
+def process_memory(pid="self"):
+    fields = {"Rss": "rss", "Pss": "pss", "Private_Clean": "uss", "Private_Dirty": "uss"}
+    memory = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", encoding="ascii") as file:
+            for line in file:
+                name, _, value = line.partition(":")
+                if name in fields:
+                    key = fields[name]
+                    memory[key] = memory.get(key, 0) + int(value.split()[0]) * 1024
+    except OSError:
+        return {}
+    return memory
+
+
+# Request-path instrumentation of the API: per-stage latency histograms, HTTP request latency,
+# tokens per LLM request and event counters, rendered in the Prometheus text format. Gauges
+# and counters the app already keeps (cache and batcher stats) are added by collectors at
+# scrape time, so they cost nothing per request. With enabled=False every recording call
+# returns right away and timers are a shared no-op, for near-zero overhead.
+class Metrics:
+    def __init__(self, enabled=True, namespace="docubot"):
+        self.enabled = enabled
+        self.namespace = namespace
+        self.instruments = []
+        self.collectors = []
+
+        self.stage_seconds = self.histogram("stage_seconds", "Seconds spent in each stage of handling a request", ["stage"])
+        self.request_seconds = self.histogram(
+            "http_request_seconds", "Seconds until the response starts, by route", ["method", "route", "status"]
+        )
+        self.tokens = self.histogram("llm_tokens", "Tokens per LLM request, by kind", ["kind"], buckets=TOKEN_BUCKETS)
+        self.events = self.counter("events_total", "Counted events, such as cache hits and misses", ["event"])
+
+    def histogram(self, name, help_text, label_names=(), buckets=SECONDS_BUCKETS):
+        histogram = Histogram(f"{self.namespace}_{name}", help_text, label_names, buckets)
+        self.instruments.append(histogram)
+        return histogram
+
+    def counter(self, name, help_text, label_names=()):
+        counter = Counter(f"{self.namespace}_{name}", help_text, label_names)
+        self.instruments.append(counter)
+        return counter
+
+    def add_collector(self, collect):
+        # collect() returns (name, type, help, [(labels dict, value), ...]) tuples at scrape time
+        self.collectors.append(collect)
+
+    def timer(self, stage):
+        if not self.enabled:
+            return NULL_TIMER
+        return _Timer(self.stage_seconds, (stage,))
+
+    def observe_stage(self, stage, seconds):
+        if self.enabled:
+            self.stage_seconds.observe(seconds, (stage,))
+
+    def observe_request(self, method, route, status, seconds):
+        if self.enabled:
+            self.request_seconds.observe(seconds, (method, route, str(status)))
+
+    def observe_tokens(self, kind, tokens):
+        if self.enabled:
+            self.tokens.observe(tokens, (kind,))
+
+    def count(self, event, amount=1):
+        if self.enabled:
+            self.events.inc((event,), amount)
+
+    def render(self):
+        lines = []
+        if self.enabled:
+            for instrument in self.instruments:
+                lines.extend(instrument.render())
+        for collect in self.collectors:
+            for name, metric_type, help_text, samples in collect():
+                name = f"{self.namespace}_{name}"
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
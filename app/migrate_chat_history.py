@@ -0,0 +1,87 @@
+import argparse
+from datetime import datetime
+
+from sqlalchemy import (Column, DateTime, ForeignKey, Integer, MetaData, String, Table, create_engine,
+                        inspect, text)
+
+# Batch size of the row copy
+COPY_BATCH_SIZE = 5000
+
+# Stand-in for timestamps that cannot be parsed; sorts such rows before all real entries
+FALLBACK_TIMESTAMP = datetime(1970, 1, 1)
+
+INDEX_NAME = "ix_chat_history_user_framework_timestamp"
+
+
+# chat_history as it is declared in main.py, under a temporary name while the copy runs
+def new_chat_history_table(metadata, name):
+    return Table(
+        name, metadata,
+        Column("id", Integer, primary_key=True),
+        Column("user_id", Integer, ForeignKey("users.id")),
+        Column("framework", String),
+        Column("question", String),
+        Column("answer", String),
+        Column("timestamp", DateTime, nullable=False),
+    )
+
+
+def parse_timestamp(value):
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return FALLBACK_TIMESTAMP
+
+
+# Rebuilds chat_history with a real DATETIME timestamp column (the old String column held
+# str(datetime) values) and creates the composite (user_id, framework, timestamp, id) index
+# used by the paginated /history/ endpoint. Safe to run more than once.
+def migrate(database_url):
+    engine = create_engine(database_url)
+    inspector = inspect(engine)
+    if not inspector.has_table("chat_history"):
+        print("No chat_history table, nothing to migrate")
+        return
+
+    timestamp_type = next(c["type"] for c in inspector.get_columns("chat_history") if c["name"] == "timestamp")
+    if isinstance(timestamp_type, DateTime):
+        print("chat_history.timestamp is already a DATETIME column")
+    else:
+        metadata = MetaData()
+        copied = 0
+        with engine.begin() as conn:
+            # users is reflected so the new table's foreign key resolves
+            Table("users", metadata, autoload_with=conn)
+            new_table = new_chat_history_table(metadata, "chat_history_new")
+            new_table.create(conn)
+            rows = conn.execute(text(
+                "SELECT id, user_id, framework, question, answer, timestamp FROM chat_history ORDER BY id"
+            )).mappings()
+            while True:
+                batch = rows.fetchmany(COPY_BATCH_SIZE)
+                if not batch:
+                    break
+                conn.execute(new_table.insert(), [
+                    {**row, "timestamp": parse_timestamp(row["timestamp"])} for row in batch
+                ])
+                copied += len(batch)
+            conn.execute(text("DROP TABLE chat_history"))
+            conn.execute(text("ALTER TABLE chat_history_new RENAME TO chat_history"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_chat_history_id ON chat_history (id)"))
+        print(f"Copied {copied} chat history rows into a DATETIME timestamp column")
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON chat_history (user_id, framework, timestamp, id)"
+        ))
+    print(f"Index {INDEX_NAME} is in place")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate chat_history to the indexed DATETIME schema.")
+    parser.add_argument("--database-url", default="sqlite:///./test.db",
+                        help="Database to migrate (default: the app's sqlite:///./test.db)")
+    args = parser.parse_args()
+    migrate(args.database_url)
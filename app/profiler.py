@@ -0,0 +1,102 @@
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+# Default sampling config: stacks are taken every interval while a profiled request runs
+DEFAULT_INTERVAL_MS = 5.0
+DEFAULT_SAMPLE_RATE = 1.0
+
+# Oldest profiles are deleted beyond this many
+DEFAULT_MAX_PROFILES = 100
+
+
+def _folded_stack(thread_name, frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    names.append(thread_name)
+    return ";".join(reversed(names))
+
+
+# Sampling profiler for slow requests. A sampler thread runs only while profiled requests are
+# in flight and takes the stack of every thread (the event loop, the search and auth pools,
+# the embedding batcher, ...) every interval. Samples are not tied to a request: a profile
+# holds everything the process did while the request ran. Requests slower than threshold_ms
+# get their profile written in the folded stack format (one "frame;frame;... count" line per
+# stack), which flamegraph.pl and speedscope read; faster requests are just dropped.
+class SlowRequestProfiler:
+    def __init__(self, threshold_ms, output_dir, interval_ms=DEFAULT_INTERVAL_MS, sample_rate=DEFAULT_SAMPLE_RATE,
+                 max_profiles=DEFAULT_MAX_PROFILES):
+        self.threshold = threshold_ms / 1000
+        self.output_dir = output_dir
+        self.interval = interval_ms / 1000
+        self.sample_rate = sample_rate
+        self.max_profiles = max_profiles
+
+        self.sessions = {}
+        self.next_session = 0
+        self.lock = threading.Lock()
+        self.wake = threading.Condition(self.lock)
+        self.thread = None
+        self.written = 0
+
+    def start(self):
+        # Returns a session id, or None when this request is not sampled
+        if random.random() >= self.sample_rate:
+            return None
+        with self.lock:
+            session = self.next_session
+            self.next_session += 1
+            self.sessions[session] = Counter()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+                self.thread.start()
+            self.wake.notify()
+            return session
+
+    def stop(self, session, seconds, label):
+        with self.lock:
+            samples = self.sessions.pop(session)
+        if seconds >= self.threshold and samples:
+            path = self._write(samples, seconds, label)
+            print(f"Slow request {label} took {seconds * 1000:.0f}ms, profile written to {path}")
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            with self.lock:
+                while not self.sessions:
+                    self.wake.wait()
+            time.sleep(self.interval)
+
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = [
+                _folded_stack(names.get(thread_id, str(thread_id)), frame)
+                for thread_id, frame in sys._current_frames().items()
+                if thread_id != own_id
+            ]
+            with self.lock:
+                for samples in self.sessions.values():
+                    samples.update(stacks)
+
+    def _write(self, samples, seconds, label):
+        os.makedirs(self.output_dir, exist_ok=True)
+        safe_label = "".join(c if c.isalnum() else "_" for c in label).strip("_")
+        path = os.path.join(
+            self.output_dir, f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{safe_label}-{seconds * 1000:.0f}ms.folded"
+        )
+        with open(path, "w", encoding="utf-8") as file:
+            for stack, count in samples.most_common():
+                file.write(f"{stack} {count}\n")
+
+        self.written += 1
+        profiles = sorted(name for name in os.listdir(self.output_dir) if name.endswith(".folded"))
+        for name in profiles[:max(len(profiles) - self.max_profiles, 0)]:
+            os.remove(os.path.join(self.output_dir, name))
+        return path
@@ -0,0 +1,129 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from langchain_core.embeddings import Embeddings
+
+# Default batching config: the most queries embedded in one forward pass, how long the first
+# query of a batch waits for company, and how many recent query vectors are kept
+DEFAULT_MAX_BATCH_SIZE = 64
+DEFAULT_MAX_WAIT_MS = 5.0
+DEFAULT_LRU_SIZE = 4096
+
+_STOP = object()
+
+
+# Embeddings wrapper that coalesces concurrent embed_query calls from many request threads
+# into one batched forward pass on a single batcher thread, and serves recently embedded
+# queries from an in-memory LRU. The first query of a batch waits at most `max_wait_ms` for
+# others to join it. Document embedding is passed straight through to the wrapped model.
+class BatchingQueryEmbeddings(Embeddings):
+    def __init__(self, embeddings, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS,
+                 lru_size=DEFAULT_LRU_SIZE):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.lru_size = lru_size
+
+        self.lru = OrderedDict()
+        self.lock = threading.Lock()
+        self.pending = queue.Queue()
+
+        self.lru_hits = 0
+        self.batches = 0
+        self.batched_queries = 0
+        self.embed_seconds = 0.0
+
+        self.thread = threading.Thread(target=self._run, name="query-embedding-batcher", daemon=True)
+        self.thread.start()
+
+    def _embed_batch(self, texts):
+        # Prefer a batched query method, else fall back to one embed_query call per text
+        embed_queries = getattr(self.embeddings, "embed_queries", None)
+        if embed_queries is not None:
+            return embed_queries(texts)
+        return [self.embeddings.embed_query(text) for text in texts]
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self.pending.get(timeout=remaining) if remaining > 0 else self.pending.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self.pending.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self.pending.get()
+            if first is _STOP:
+                return
+            batch = self._collect(first)
+
+            # Identical questions in the same window share one row of the batch
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            started_at = time.perf_counter()
+            try:
+                vectors = dict(zip(texts, self._embed_batch(texts)))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.embed_seconds += time.perf_counter() - started_at
+            self.batches += 1
+            self.batched_queries += len(texts)
+
+            with self.lock:
+                for text, vector in vectors.items():
+                    self.lru[text] = vector
+                    self.lru.move_to_end(text)
+                while len(self.lru) > self.lru_size:
+                    self.lru.popitem(last=False)
+            for text, future in batch:
+                future.set_result(list(vectors[text]))
+
+    def submit(self, text):
+        # Returns a concurrent Future of the query vector, so async callers can await it
+        # (asyncio.wrap_future) without tying up a thread while the batch fills
+        future = Future()
+        with self.lock:
+            vector = self.lru.get(text)
+            if vector is not None:
+                self.lru.move_to_end(text)
+                self.lru_hits += 1
+                future.set_result(list(vector))
+                return future
+
+        self.pending.put((text, future))
+        return future
+
+    def embed_query(self, text):
+        return self.submit(text).result()
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def close(self):
+        # Queries already waiting are still embedded before the batcher thread exits
+        self.pending.put(_STOP)
+        self.thread.join()
+
+    def stats(self):
+        return {
+            "lru_hits": self.lru_hits,
+            "lru_entries": len(self.lru),
+            "batches": self.batches,
+            "batched_queries": self.batched_queries,
+            "mean_batch_size": self.batched_queries / self.batches if self.batches else 0.0,
+            "embed_seconds": round(self.embed_seconds, 3),
+        }
@@ -1,53 +1,126 @@
+import json
+import os
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # FastAPI backend URL
-backend_url = "http://localhost:8000"
+backend_url = os.getenv("BACKEND_URL", "http://localhost:8000")
+
+# Backend timeouts in seconds, as (connect, read); a streamed answer may go quiet between tokens
+# for up to the stream read timeout before it is given up on
+REQUEST_TIMEOUT = (3.05, float(os.getenv("BACKEND_TIMEOUT_SECONDS", "30")))
+STREAM_TIMEOUT = (3.05, float(os.getenv("BACKEND_STREAM_TIMEOUT_SECONDS", "90")))
+
+# Chat history entries fetched per page, and per "Load more"
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "10"))
+
+# One pooled HTTP session for the whole Streamlit server, shared by every browser session and
+# rerun, so backend calls reuse keep-alive connections instead of opening one each. Failed
+# connection attempts are retried; requests that reached the backend never are.
+@st.cache_resource
+def get_http_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=32, max_retries=Retry(total=2, connect=2, read=0, backoff_factor=0.2))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+http = get_http_session()
 
 # Initialize session state for tracking authentication and user state
 if 'access_token' not in st.session_state:
     st.session_state.access_token = None
 
+# Chat history pages fetched so far, per framework; reruns render from here, and a framework's
+# entry is only dropped when a new answer is added to its history
+if 'history' not in st.session_state:
+    st.session_state.history = {}
+
 def login_user(email, password):
     # Request to log in and get a JWT token
-    response = requests.post(f"{backend_url}/token", data={"username": email, "password": password})
+    try:
+        response = http.post(f"{backend_url}/token", data={"username": email, "password": password}, timeout=REQUEST_TIMEOUT)
+    except requests.RequestException:
+        st.error("Could not reach the server. Please try again.")
+        return
     if response.status_code == 200:
         token_data = response.json()
         st.session_state.access_token = token_data['access_token']
+        st.session_state.history = {}
         st.success("Logged in successfully!")
     else:
         st.error("Failed to log in. Check your email and password.")
 
 def register_user(email, password):
     # Request to register a new user
-    response = requests.post(f"{backend_url}/register/", json={"email": email, "password": password})
+    try:
+        response = http.post(f"{backend_url}/register/", json={"email": email, "password": password}, timeout=REQUEST_TIMEOUT)
+    except requests.RequestException:
+        st.error("Could not reach the server. Please try again.")
+        return
     if response.status_code == 200:
         token_data = response.json()
         st.session_state.access_token = token_data['access_token']
+        st.session_state.history = {}
         st.success("Registered successfully and logged in!")
     else:
         st.error("Failed to register. The email might be taken.")
 
-def query_chatbot(framework, question):
-    # Request to query the chatbot
+def query_chatbot_stream(framework, question):
+    # Request a streamed answer and yield its tokens as the server sends them
     headers = {"Authorization": f"Bearer {st.session_state.access_token}"}
-    response = requests.post(f"{backend_url}/query", json={"framework": framework, "question": question}, headers=headers)
-    if response.status_code == 200:
-        return response.json()['answer']
-    else:
-        st.error("Failed to get a response from the chatbot.")
-        return None
-
-def get_chat_history(framework):
-    # Request to get chat history filtered by framework
+    try:
+        with http.post(f"{backend_url}/query/stream", json={"framework": framework, "question": question}, headers=headers,
+                       stream=True, timeout=STREAM_TIMEOUT) as response:
+            if response.status_code != 200:
+                st.error("Failed to get a response from the chatbot.")
+                return
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    data = json.loads(line[len("data: "):])
+                    if event == "token":
+                        yield data["token"]
+                    elif event == "error":
+                        st.error("Failed to get a response from the chatbot.")
+                        return
+    except requests.RequestException:
+        st.error("Lost the connection to the chatbot before the answer was complete.")
+
+def get_chat_history(framework, cursor=None):
+    # Request one page of chat history filtered by framework, newest first; pass the page's
+    # next_cursor to get the page after it
     headers = {"Authorization": f"Bearer {st.session_state.access_token}"}
-    response = requests.get(f"{backend_url}/history/?framework={framework}", headers=headers)
+    params = {"framework": framework, "limit": HISTORY_PAGE_SIZE}
+    if cursor:
+        params["cursor"] = cursor
+    try:
+        response = http.get(f"{backend_url}/history/", params=params, headers=headers, timeout=REQUEST_TIMEOUT)
+    except requests.RequestException:
+        st.error("Failed to retrieve chat history.")
+        return None
     if response.status_code == 200:
-        return response.json()['history']
+        return response.json()
     else:
         st.error("Failed to retrieve chat history.")
         return None
 
+def load_history_page(framework):
+    # Fetch the next page of a framework's history into the cache (the first page when nothing
+    # is cached yet)
+    cached = st.session_state.history.get(framework)
+    page = get_chat_history(framework, cached["next_cursor"] if cached else None)
+    if page is None:
+        return
+    if cached is None:
+        cached = st.session_state.history[framework] = {"entries": [], "next_cursor": None}
+    cached["entries"].extend(page["history"])
+    cached["next_cursor"] = page["next_cursor"]
+
 # Authentication Section
 st.sidebar.title("Authentication")
 
@@ -55,6 +128,7 @@ if st.session_state.access_token:
     st.sidebar.success("You are logged in.")
     if st.sidebar.button("Logout"):
         st.session_state.access_token = None
+        st.session_state.history = {}
         st.experimental_rerun()  # Clear the UI state and rerun the app
 else:
     auth_choice = st.sidebar.selectbox("Select an option", ["Login", "Register"])
@@ -88,26 +162,44 @@ if st.session_state.access_token:
         framework = "Flutter"
         st.subheader("Ask me anything about Flutter")
 
-    # Input for the chatbot
-    question = st.text_area(f"Enter your question about {framework}")
+    # Input for the chatbot, in a form so typing does not rerun the script
+    with st.form("question_form"):
+        question = st.text_area(f"Enter your question about {framework}")
+
+        # Submit button
+        submitted = st.form_submit_button("Submit")
 
-    # Submit button
-    if st.button("Submit"):
+    if submitted:
         if question:
-            answer = query_chatbot(framework, question)
+            # Render the answer token by token as it streams in
+            answer_placeholder = st.empty()
+            answer = ""
+            for token in query_chatbot_stream(framework, question):
+                answer += token
+                answer_placeholder.markdown(f"**Answer:** {answer}")
             if answer:
-                st.write(f"**Answer:** {answer}")
+                # The answer is now in this framework's history, so the cached pages are stale
+                st.session_state.history.pop(framework, None)
         else:
             st.error("Please enter a question.")
 
-    # Chat History Section
+    # Chat History Section: nothing is fetched until it is opened, then the first page once
+    # (until the next answer) and further pages only on "Load more"
     st.subheader("Chat History")
-    history = get_chat_history(framework)  # Pass the selected framework to the history function
-    if history:
-        for entry in history:
-            # Create an expander for each question
-            with st.expander(f"Question: {entry['question']}"):
-                st.write(f"**Answer:** {entry['answer']}")
-                st.write(f"**Timestamp:** {entry['timestamp']}")
+    if st.checkbox("Show chat history", key=f"show_history_{framework}"):
+        if framework not in st.session_state.history:
+            load_history_page(framework)
+        cached = st.session_state.history.get(framework)
+        if cached is not None:
+            if not cached["entries"]:
+                st.info(f"No questions about {framework} yet.")
+            for entry in cached["entries"]:
+                # Create an expander for each question
+                with st.expander(f"Question: {entry['question']}"):
+                    st.write(f"**Answer:** {entry['answer']}")
+                    st.write(f"**Timestamp:** {entry['timestamp']}")
+            if cached["next_cursor"]:
+                # The page is fetched in the click callback, so this same rerun already shows it
+                st.button("Load more", on_click=load_history_page, args=(framework,), key=f"load_more_{framework}")
 else:
     st.title("Please log in or register to use the chatbot.")
@@ -0,0 +1,139 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import requests
+
+# Questions sent per /query/batch request; an interrupted run only loses the answers of the
+# request in flight
+DEFAULT_CHUNK_SIZE = 100
+
+# Attempts per chunk before the run gives up
+REQUEST_ATTEMPTS = 3
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Answer a JSONL file of {framework, question} records through the /query/batch API. "
+                    "Answers are appended to the output file as they arrive; rerunning the same command "
+                    "resumes where an interrupted run stopped."
+    )
+    parser.add_argument("input", help="JSONL file of {framework, question} records, with an optional id")
+    parser.add_argument("--output", default=None, help="JSONL file of answers (default: <input>.answers.jsonl)")
+    parser.add_argument("--api-url", default="http://localhost:8000", help="Docu-bot API (default: http://localhost:8000)")
+    parser.add_argument("--email", default=os.getenv("DOCUBOT_EMAIL"), help="Account email (default: $DOCUBOT_EMAIL)")
+    parser.add_argument("--password", default=os.getenv("DOCUBOT_PASSWORD"),
+                        help="Account password (default: $DOCUBOT_PASSWORD)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"Questions per API request (default: {DEFAULT_CHUNK_SIZE})")
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds to wait on one API request (default: 600)")
+    parser.add_argument("--save-history", action="store_true", help="Also store the answers in the account's chat history")
+    parser.add_argument("--retry-errors", action="store_true",
+                        help="Ask again the questions that got an error in a previous run")
+    args = parser.parse_args()
+    if not args.email or not args.password:
+        parser.error("--email and --password (or DOCUBOT_EMAIL and DOCUBOT_PASSWORD) are required")
+    return args
+
+
+# Records are keyed by their id, or by their line number when they have none
+def read_records(path):
+    records = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "framework" not in record or "question" not in record:
+                print(f"Skipping line {line_number}: no framework or question")
+                continue
+            record["id"] = str(record.get("id", line_number))
+            records.append(record)
+    return records
+
+
+# Ids already answered by earlier runs; a line torn by an interruption is ignored
+def read_done_ids(path, retry_errors):
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "answer" in result or not retry_errors:
+                done.add(result["id"])
+    return done
+
+
+def login(args):
+    response = requests.post(f"{args.api_url}/token", data={"username": args.email, "password": args.password},
+                             timeout=args.timeout)
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def answer_chunk(args, token, chunk, output):
+    # Stream one batch, appending each answer as soon as it arrives; returns the results
+    items = [{"id": record["id"], "framework": record["framework"], "question": record["question"]} for record in chunk]
+    results = []
+    with requests.post(
+        f"{args.api_url}/query/batch",
+        json={"items": items, "save_history": args.save_history},
+        headers={"Authorization": f"Bearer {token}"},
+        stream=True,
+        timeout=args.timeout
+    ) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            result = json.loads(line)
+            result.pop("index", None)
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+            results.append(result)
+    return results
+
+
+def run(args):
+    output_path = args.output or f"{os.path.splitext(args.input)[0]}.answers.jsonl"
+    records = read_records(args.input)
+    done = read_done_ids(output_path, args.retry_errors)
+    pending = [record for record in records if record["id"] not in done]
+    print(f"{len(records)} questions in {args.input}, {len(records) - len(pending)} already answered in {output_path}")
+
+    token = login(args)
+    started_at = time.perf_counter()
+    results = []
+    with open(output_path, "a", encoding="utf-8") as output:
+        for start in range(0, len(pending), args.chunk_size):
+            chunk = pending[start:start + args.chunk_size]
+            for attempt in range(REQUEST_ATTEMPTS):
+                try:
+                    results.extend(answer_chunk(args, token, chunk, output))
+                    break
+                except requests.RequestException as e:
+                    # An expired token is renewed; questions answered before the failure are kept
+                    if isinstance(e, requests.HTTPError) and e.response.status_code == 401:
+                        token = login(args)
+                    print(f"Batch request failed (attempt {attempt + 1}): {e}")
+                    if attempt == REQUEST_ATTEMPTS - 1:
+                        print("Giving up; rerun the same command to resume")
+                        sys.exit(1)
+                    time.sleep(2 ** attempt)
+                    answered_ids = read_done_ids(output_path, args.retry_errors)
+                    chunk = [record for record in chunk if record["id"] not in answered_ids]
+            print(f"Answered {min(start + args.chunk_size, len(pending))}/{len(pending)} questions")
+
+    errors = sum(1 for result in results if "error" in result)
+    print(f"Done: {len(results) - errors} answers and {errors} errors in {time.perf_counter() - started_at:.1f}s, "
+          f"written to {output_path}")
+
+
+if __name__ == "__main__":
+    run(parse_args())
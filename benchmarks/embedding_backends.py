@@ -0,0 +1,160 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# The app modules use bare imports, as when the API runs from app/
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "app"))
+
+from chroma_db import FRAMEWORKS  # noqa: E402
+from hf_embeddings import EMBEDDING_BACKENDS, load_embeddings  # noqa: E402
+from synthetic_corpus import generate_chunks, generate_questions  # noqa: E402
+
+REFERENCE_BACKEND = "torch"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Check that the ONNX embedding backends give the same vectors and rankings as the PyTorch "
+                    "model, and compare their throughput and query latency."
+    )
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="Embedding model (default: all-MiniLM-L6-v2)")
+    parser.add_argument("--backends", default=",".join(EMBEDDING_BACKENDS),
+                        help=f"Backends to compare with {REFERENCE_BACKEND} (default: {','.join(EMBEDDING_BACKENDS)})")
+    parser.add_argument("--threads", type=int, default=None, help="CPU threads per backend (default: the backend's)")
+    parser.add_argument("--onnx-dir", default="./onnx_models", help="Directory of the ONNX exports (default: ./onnx_models)")
+    parser.add_argument("--db-path", default=None,
+                        help="Chroma database to take documents and their stored vectors from "
+                             "(default: a synthetic corpus)")
+    parser.add_argument("--collection", default="FastAPI", help="Collection sampled with --db-path (default: FastAPI)")
+    parser.add_argument("--documents", type=int, default=1000, help="Documents embedded per backend (default: 1000)")
+    parser.add_argument("--queries", type=int, default=200, help="Questions embedded one by one per backend (default: 200)")
+    parser.add_argument("--k", type=int, default=5, help="Neighbours compared for ranking parity (default: 5)")
+    parser.add_argument("--min-cosine", type=float, default=0.98,
+                        help="Lowest 1st-percentile cosine to the reference vectors that passes (default: 0.98)")
+    parser.add_argument("--output", default=None, help="Also write the results to this JSON file")
+    return parser.parse_args()
+
+
+def load_documents(args):
+    # Documents, and the vectors they are stored with when they come from a collection
+    if args.db_path is None:
+        frameworks = list(FRAMEWORKS)
+        per_framework = -(-args.documents // len(frameworks))
+        texts = [doc.page_content for framework in frameworks for _, doc in generate_chunks(framework, per_framework)]
+        return texts[:args.documents], None
+
+    import chromadb
+
+    collection = chromadb.PersistentClient(path=args.db_path).get_collection(args.collection)
+    result = collection.get(limit=args.documents, include=["documents", "embeddings"])
+    return result["documents"], np.asarray(result["embeddings"], dtype=np.float32)
+
+
+def load_questions(args):
+    frameworks = list(FRAMEWORKS)
+    per_framework = -(-args.queries // len(frameworks))
+    return [question for framework in frameworks for question in generate_questions(framework, per_framework)][:args.queries]
+
+
+def cosine_summary(vectors, reference):
+    cosines = np.sum(vectors * reference, axis=1) / (
+        np.linalg.norm(vectors, axis=1) * np.linalg.norm(reference, axis=1) + 1e-12
+    )
+    return {
+        "mean": round(float(np.mean(cosines)), 5),
+        "p1": round(float(np.percentile(cosines, 1)), 5),
+        "min": round(float(np.min(cosines)), 5),
+    }
+
+
+def top_k(query_vectors, document_vectors, k):
+    return np.argsort(-(query_vectors @ document_vectors.T), axis=1)[:, :k]
+
+
+def overlap_at_k(ranking, reference_ranking):
+    k = ranking.shape[1]
+    return round(float(np.mean([len(set(a) & set(b)) / k for a, b in zip(ranking, reference_ranking)])), 4)
+
+
+def measure_backend(backend, documents, questions, args):
+    started_at = time.perf_counter()
+    embeddings = load_embeddings(args.model, backend, args.threads, args.onnx_dir)
+    load_seconds = time.perf_counter() - started_at
+
+    # One warm-up batch, so the first-call overhead is not counted as throughput
+    embeddings.embed_documents(documents[:32])
+    started_at = time.perf_counter()
+    document_vectors = np.asarray(embeddings.embed_documents(documents), dtype=np.float32)
+    document_seconds = time.perf_counter() - started_at
+
+    latencies = []
+    query_vectors = []
+    for question in questions:
+        started_at = time.perf_counter()
+        query_vectors.append(embeddings.embed_query(question))
+        latencies.append(time.perf_counter() - started_at)
+    latencies = np.asarray(latencies) * 1000
+
+    result = {
+        "load_seconds": round(load_seconds, 3),
+        "documents_per_second": round(len(documents) / document_seconds, 1),
+        "query_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "query_p95_ms": round(float(np.percentile(latencies, 95)), 2),
+    }
+    return result, document_vectors, np.asarray(query_vectors, dtype=np.float32)
+
+
+def run(args):
+    backends = [backend for backend in args.backends.split(",") if backend]
+    documents, stored_vectors = load_documents(args)
+    questions = load_questions(args)
+    report = {"model": args.model, "threads": args.threads, "documents": len(documents), "queries": len(questions),
+              "backends": {}}
+
+    reference = None
+    for backend in [REFERENCE_BACKEND] + [backend for backend in backends if backend != REFERENCE_BACKEND]:
+        print(f"Measuring the {backend} backend...")
+        result, document_vectors, query_vectors = measure_backend(backend, documents, questions, args)
+        if reference is None:
+            reference = (document_vectors, query_vectors, top_k(query_vectors, document_vectors, args.k))
+        reference_documents, reference_queries, reference_ranking = reference
+        if document_vectors.shape[1] != reference_documents.shape[1]:
+            raise ValueError(f"The {backend} backend gives {document_vectors.shape[1]}-dimensional vectors, "
+                             f"{REFERENCE_BACKEND} {reference_documents.shape[1]}-dimensional ones")
+
+        result["document_cosine"] = cosine_summary(document_vectors, reference_documents)
+        result["query_cosine"] = cosine_summary(query_vectors, reference_queries)
+        if stored_vectors is not None:
+            result["stored_vector_cosine"] = cosine_summary(document_vectors, stored_vectors)
+
+        # Rankings when everything is re-embedded with the backend, and when only the queries are
+        # (the backend serving a collection indexed with the reference model)
+        result[f"overlap@{args.k}"] = overlap_at_k(top_k(query_vectors, document_vectors, args.k), reference_ranking)
+        result[f"overlap@{args.k}_queries_only"] = overlap_at_k(
+            top_k(query_vectors, reference_documents, args.k), reference_ranking
+        )
+        result["parity"] = (
+            result["document_cosine"]["p1"] >= args.min_cosine and result["query_cosine"]["p1"] >= args.min_cosine
+        )
+        report["backends"][backend] = result
+    return report
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run(args)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+    failed = [backend for backend, result in report["backends"].items() if not result["parity"]]
+    if failed:
+        print(f"Below the parity threshold ({args.min_cosine}): {', '.join(failed)}")
+        sys.exit(1)
@@ -0,0 +1,88 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Local stand-in for the OpenAI chat completions API, so benchmarks measure docu-bot and not
+# OpenAI. Each completion waits FAKE_LLM_LATENCY_MS before its first token, then produces
+# FAKE_LLM_ANSWER_TOKENS tokens (or max_tokens, if lower) at FAKE_LLM_TOKENS_PER_SECOND.
+LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "300"))
+TOKENS_PER_SECOND = float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "100"))
+ANSWER_TOKENS = int(os.getenv("FAKE_LLM_ANSWER_TOKENS", "50"))
+
+app = FastAPI()
+
+stats = {"completions": 0, "prompt_characters": 0}
+
+
+def answer_tokens(body):
+    count = min(ANSWER_TOKENS, body.get("max_tokens") or ANSWER_TOKENS)
+    return [f" token{i}" for i in range(count)]
+
+
+def chunk_event(content):
+    chunk = {
+        "id": "fake",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": "fake",
+        "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}],
+    }
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    tokens = answer_tokens(body)
+    stats["completions"] += 1
+    stats["prompt_characters"] += sum(len(message.get("content") or "") for message in body.get("messages", []))
+
+    if body.get("stream"):
+        async def event_stream():
+            await asyncio.sleep(LATENCY_MS / 1000)
+            for token in tokens:
+                yield chunk_event(token)
+                await asyncio.sleep(1 / TOKENS_PER_SECOND)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+    await asyncio.sleep(LATENCY_MS / 1000 + len(tokens) / TOKENS_PER_SECOND)
+    return JSONResponse({
+        "id": "fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "fake",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens).strip()}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+    })
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve a fake OpenAI chat completions API for benchmarks.")
+    parser.add_argument("--port", type=int, default=9001, help="Port to listen on (default: 9001)")
+    parser.add_argument("--latency-ms", type=float, default=LATENCY_MS, help=f"Time to first token (default: {LATENCY_MS})")
+    parser.add_argument("--tokens-per-second", type=float, default=TOKENS_PER_SECOND,
+                        help=f"Token rate after the first token (default: {TOKENS_PER_SECOND})")
+    parser.add_argument("--answer-tokens", type=int, default=ANSWER_TOKENS,
+                        help=f"Tokens per answer (default: {ANSWER_TOKENS})")
+    args = parser.parse_args()
+
+    LATENCY_MS = args.latency_ms
+    TOKENS_PER_SECOND = args.tokens_per_second
+    ANSWER_TOKENS = args.answer_tokens
+    print(f"Fake LLM on port {args.port}: {LATENCY_MS}ms to first token, {TOKENS_PER_SECOND} tokens/s, "
+          f"{ANSWER_TOKENS} tokens per answer")
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
@@ -0,0 +1,103 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# The app modules use bare imports, as when the API runs from app/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from chroma_db import ChromaDBHandler  # noqa: E402
+
+# Identifier-heavy questions; a retrieved chunk counts as relevant when it contains one of the
+# expected strings verbatim
+DEFAULT_QUERIES = [
+    {"framework": "FastAPI", "question": "How do I declare a dependency with Depends?", "expected": ["Depends("]},
+    {"framework": "FastAPI", "question": "How do I run work after the response with BackgroundTasks?", "expected": ["BackgroundTasks"]},
+    {"framework": "FastAPI", "question": "How do I raise an HTTPException with a 404?", "expected": ["HTTPException"]},
+    {"framework": "FastAPI", "question": "What does response_model do on a path operation?", "expected": ["response_model"]},
+    {"framework": "Django", "question": "How does select_related reduce the number of queries?", "expected": ["select_related"]},
+    {"framework": "Django", "question": "When should I use prefetch_related?", "expected": ["prefetch_related"]},
+    {"framework": "Django", "question": "How do I use get_object_or_404 in a view?", "expected": ["get_object_or_404"]},
+    {"framework": "RubyOnRails", "question": "How do I define a has_many association?", "expected": ["has_many"]},
+    {"framework": "RubyOnRails", "question": "What does before_action do in a controller?", "expected": ["before_action"]},
+    {"framework": "RubyOnRails", "question": "How do I use validates with presence?", "expected": ["validates"]},
+    {"framework": "Flutter", "question": "When do I need a StatefulWidget?", "expected": ["StatefulWidget"]},
+    {"framework": "Flutter", "question": "How does setState trigger a rebuild?", "expected": ["setState"]},
+    {"framework": "Flutter", "question": "How do I show async data with FutureBuilder?", "expected": ["FutureBuilder"]},
+]
+
+
+def load_queries(path):
+    if path is None:
+        return DEFAULT_QUERIES
+    with open(path, "r", encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def relevant_count(docs, expected):
+    return sum(1 for doc in docs if any(text in doc.page_content for text in expected))
+
+
+def summarize(latencies):
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 2),
+        "mean_ms": round(float(np.mean(latencies)) * 1000, 2),
+    }
+
+
+# Compare vector-only and hybrid (vector + BM25, fused by RRF) retrieval on the same questions:
+# hit rate (a relevant chunk in the top k), precision at k and search latency
+def run(args):
+    handler = ChromaDBHandler(db_path=args.db_path, cache_dir=None)
+    queries = [query for query in load_queries(args.queries) if query["framework"] in handler.frameworks]
+    handler.warm_up({query["framework"] for query in queries})
+
+    results = {"vector": {"hits": 0, "relevant": 0, "latencies": []}, "hybrid": {"hits": 0, "relevant": 0, "latencies": []}}
+    skipped = set()
+    for query in queries:
+        if handler.get_bm25_index(query["framework"]) is None:
+            skipped.add(query["framework"])
+            continue
+        query_vector = handler.embedding_model.embed_query(query["question"])
+        for mode, hybrid in (("vector", False), ("hybrid", True)):
+            for _ in range(args.repeat):
+                started_at = time.perf_counter()
+                docs = handler.search(query["framework"], query["question"], query_vector,
+                                      k=args.k, candidates=args.candidates, hybrid=hybrid)
+                results[mode]["latencies"].append(time.perf_counter() - started_at)
+            relevant = relevant_count(docs, query["expected"])
+            results[mode]["hits"] += relevant > 0
+            results[mode]["relevant"] += relevant
+    handler.close()
+
+    evaluated = len(queries) - sum(1 for query in queries if query["framework"] in skipped)
+    report = {"k": args.k, "candidates": args.candidates, "queries": evaluated, "skipped_frameworks": sorted(skipped)}
+    for mode, result in results.items():
+        report[mode] = {
+            f"hit_rate@{args.k}": round(result["hits"] / max(evaluated, 1), 3),
+            f"precision@{args.k}": round(result["relevant"] / max(evaluated * args.k, 1), 3),
+            **(summarize(result["latencies"]) if result["latencies"] else {}),
+        }
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark hybrid BM25 + vector retrieval against vector-only search.")
+    parser.add_argument("--db-path", default="./chroma_db", help="Chroma database with the BM25 indices (default: ./chroma_db)")
+    parser.add_argument("--queries", default=None,
+                        help="JSONL file of {framework, question, expected: [strings]} (default: built-in questions)")
+    parser.add_argument("--k", type=int, default=5, help="Chunks retrieved per question (default: 5)")
+    parser.add_argument("--candidates", type=int, default=20, help="Candidates per retriever before fusion (default: 20)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed searches per question and mode (default: 5)")
+    parser.add_argument("--output", default=None, help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
@@ -0,0 +1,452 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import aiohttp
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+APP_DIR = os.path.join(REPO_DIR, "app")
+
+# The app modules use bare imports, as when the API runs from app/; ingest.py imports app.*
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from chroma_db import FRAMEWORKS, ChromaDBHandler  # noqa: E402
+from ingest import BatchIngestor, IngestManifest  # noqa: E402
+from synthetic_corpus import generate_chunks, generate_questions  # noqa: E402
+
+STAGES = ["ingest", "search", "query", "history"]
+
+# Changes in these metrics are reported against a baseline run; lower is better for all but throughput
+COMPARED_SUFFIXES = ("_ms", "chunks_per_second", "throughput_rps")
+
+
+def parse_int_list(value):
+    return [int(item) for item in value.split(",") if item]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="End-to-end performance benchmarks: ingestion, vector search, /query and /history/ against a "
+                    "synthetic corpus and a local fake LLM. Results are written as JSON."
+    )
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Stages to run (default: {','.join(STAGES)})")
+    parser.add_argument("--work-dir", default=None,
+                        help="Directory for the benchmark's Chroma and SQLite data (default: a temporary directory)")
+    parser.add_argument("--keep-work-dir", action="store_true", help="Keep the work directory after the run")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic corpus and questions (default: 0)")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="Embedding model (default: all-MiniLM-L6-v2)")
+    parser.add_argument("--chunks-per-framework", type=int, default=1000,
+                        help="Synthetic chunks ingested into every framework collection (default: 1000)")
+    parser.add_argument("--search-sizes", type=parse_int_list, default=[1000, 5000, 20000],
+                        help="Collection sizes at which search latency is measured (default: 1000,5000,20000)")
+    parser.add_argument("--search-queries", type=int, default=100, help="Searches per collection size (default: 100)")
+    parser.add_argument("--batch-size", type=int, default=256, help="Ingestion batch size (default: 256)")
+    parser.add_argument("--k", type=int, default=5, help="Chunks retrieved per search (default: 5)")
+    parser.add_argument("--concurrency", type=parse_int_list, default=[1, 8, 32],
+                        help="Concurrent /query clients to measure (default: 1,8,32)")
+    parser.add_argument("--requests", type=int, default=200, help="/query requests per concurrency level (default: 200)")
+    parser.add_argument("--llm-latency-ms", type=float, default=300, help="Fake LLM time to first token (default: 300)")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=100,
+                        help="Fake LLM token rate (default: 100)")
+    parser.add_argument("--llm-answer-tokens", type=int, default=50, help="Fake LLM tokens per answer (default: 50)")
+    parser.add_argument("--answer-cache", action="store_true",
+                        help="Keep the answer cache on during /query (by default every question goes to the LLM)")
+    parser.add_argument("--history-rows", type=int, default=100000,
+                        help="Chat history rows of the benchmark user (default: 100000)")
+    parser.add_argument("--history-requests", type=int, default=100,
+                        help="Timed requests for the first history page (default: 100)")
+    parser.add_argument("--history-pages", type=int, default=50, help="History pages walked by cursor (default: 50)")
+    parser.add_argument("--output", default=None, help="JSON results file (default: benchmarks/results/<time>.json)")
+    parser.add_argument("--baseline", default=None, help="Earlier results file to compare this run against")
+    args = parser.parse_args()
+    args.stages = [stage for stage in args.stages.split(",") if stage]
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+    return args
+
+
+def latency_summary(latencies):
+    latencies = np.asarray(latencies) * 1000
+    return {
+        "count": int(len(latencies)),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+        "mean_ms": round(float(np.mean(latencies)), 2),
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Ingest the first `size` synthetic chunks of a framework the way an incremental loader run
+# over a growing docs folder would: sources ingested before are skipped by their content hash.
+# Embedding and writing are timed apart from the finalization (manifest, BM25 index, generation).
+def ingest_chunks(handler, framework, size, args):
+    collection_name = FRAMEWORKS[framework]["collection"]
+    collection = handler.client.get_or_create_collection(name=collection_name, embedding_function=None)
+    ingestor = BatchIngestor(collection, handler.embedding_model, batch_size=args.batch_size,
+                             manifest=IngestManifest(handler.db_path, collection_name), incremental=True)
+
+    sources = {}
+    for source, doc in generate_chunks(framework, size, seed=args.seed):
+        sources.setdefault(source, []).append(doc)
+
+    started_at = time.perf_counter()
+    for source, docs in sources.items():
+        metadata = {"source": source}
+        if ingestor.is_unchanged(source, "".join(doc.page_content for doc in docs), metadata):
+            continue
+        ingestor.add_documents(docs, metadata)
+    ingestor.flush()
+    ingest_seconds = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    ingestor.finish()
+    return {
+        "framework": framework,
+        "collection_size": size,
+        "chunks": ingestor.total_chunks,
+        "seconds": round(ingest_seconds, 3),
+        "chunks_per_second": round(ingestor.total_chunks / max(ingest_seconds, 1e-9), 1),
+        "embed_seconds": round(ingestor.embed_seconds, 3),
+        "write_seconds": round(ingestor.write_seconds, 3),
+        "finish_seconds": round(time.perf_counter() - started_at, 3),
+    }
+
+
+def run_ingest_and_search(handler, args):
+    # The first framework grows through every search size; the others get chunks_per_framework
+    frameworks = list(FRAMEWORKS)
+    search_framework = frameworks[0]
+    ingest_results = []
+    search_results = []
+
+    for size in sorted(set(args.search_sizes)) if "search" in args.stages else [args.chunks_per_framework]:
+        print(f"Ingesting {search_framework} up to {size} chunks...")
+        ingest_results.append(ingest_chunks(handler, search_framework, size, args))
+        if "search" in args.stages:
+            search_results.append(measure_search(handler, search_framework, size, args))
+
+    for framework in frameworks[1:]:
+        print(f"Ingesting {framework} ({args.chunks_per_framework} chunks)...")
+        ingest_results.append(ingest_chunks(handler, framework, args.chunks_per_framework, args))
+
+    total_chunks = sum(result["chunks"] for result in ingest_results)
+    total_seconds = sum(result["seconds"] for result in ingest_results)
+    ingest_report = {
+        "chunks": total_chunks,
+        "seconds": round(total_seconds, 3),
+        "chunks_per_second": round(total_chunks / max(total_seconds, 1e-9), 1),
+        "runs": ingest_results,
+    }
+    return ingest_report, search_results
+
+
+# similarity_search_by_vector latency, as the API calls it; query embedding is not timed
+def measure_search(handler, framework, size, args):
+    index = handler.get_index(framework)
+    questions = generate_questions(framework, args.search_queries, seed=args.seed)
+    vectors = handler.embedding_model.embed_documents(questions)
+    index.similarity_search_by_vector(vectors[0], k=args.k)
+
+    latencies = []
+    for vector in vectors:
+        started_at = time.perf_counter()
+        index.similarity_search_by_vector(vector, k=args.k)
+        latencies.append(time.perf_counter() - started_at)
+    result = {"framework": framework, "collection_size": size, "k": args.k, **latency_summary(latencies)}
+    print(f"Search at {size} chunks: p50 {result['p50_ms']}ms, p99 {result['p99_ms']}ms")
+    return result
+
+
+def start_process(command, cwd, env, log_path):
+    log = open(log_path, "w")
+    return subprocess.Popen(command, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def wait_until_ready(session, url, process, timeout=600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process exited with code {process.returncode} before {url} was ready")
+        try:
+            async with session.get(url) as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} was not ready after {timeout}s")
+
+
+async def get_token(session, api_url, email, password="benchmark"):
+    async with session.post(f"{api_url}/register/", json={"email": email, "password": password}) as response:
+        if response.status == 200:
+            return (await response.json())["access_token"]
+    async with session.post(f"{api_url}/token", data={"username": email, "password": password}) as response:
+        response.raise_for_status()
+        return (await response.json())["access_token"]
+
+
+async def measure_queries(session, api_url, token, concurrency, args):
+    # Questions differ across levels so the query embedding LRU does not serve them
+    frameworks = list(FRAMEWORKS)
+    questions_by_framework = {
+        framework: generate_questions(framework, args.requests, seed=f"{args.seed}:{concurrency}") for framework in frameworks
+    }
+    questions = [
+        (frameworks[i % len(frameworks)], questions_by_framework[frameworks[i % len(frameworks)]][i])
+        for i in range(args.requests)
+    ]
+    headers = {"Authorization": f"Bearer {token}"}
+    latencies = []
+    errors = 0
+    pending = iter(questions)
+
+    async def client():
+        nonlocal errors
+        for framework, question in pending:
+            started_at = time.perf_counter()
+            async with session.post(f"{api_url}/query", json={"framework": framework, "question": question},
+                                    headers=headers) as response:
+                await response.read()
+                if response.status == 200:
+                    latencies.append(time.perf_counter() - started_at)
+                else:
+                    errors += 1
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started_at
+    result = {
+        "concurrency": concurrency,
+        "requests": len(questions),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        **(latency_summary(latencies) if latencies else {}),
+    }
+    print(f"/query at concurrency {concurrency}: {result['throughput_rps']} req/s, "
+          f"p50 {result.get('p50_ms')}ms, p99 {result.get('p99_ms')}ms, {errors} errors")
+    return result
+
+
+# Give the benchmark user a large history straight in SQLite, one row per second going back
+def seed_history(database_path, email, rows):
+    connection = sqlite3.connect(database_path)
+    try:
+        user_id = connection.execute("SELECT id FROM users WHERE email = ?", (email,)).fetchone()[0]
+        newest = datetime.now(timezone.utc).replace(tzinfo=None)
+        with connection:
+            connection.executemany(
+                "INSERT INTO chat_history (user_id, framework, question, answer, timestamp) VALUES (?, ?, ?, ?, ?)",
+                (
+                    (user_id, "FastAPI", f"Benchmark question {i}", f"Benchmark answer {i}",
+                     (newest - timedelta(seconds=i)).isoformat(" ", "microseconds"))
+                    for i in range(rows)
+                )
+            )
+    finally:
+        connection.close()
+
+
+async def measure_history(session, api_url, database_path, args):
+    email = "history-benchmark@example.com"
+    token = await get_token(session, api_url, email)
+    started_at = time.perf_counter()
+    seed_history(database_path, email, args.history_rows)
+    print(f"Seeded {args.history_rows} history rows in {time.perf_counter() - started_at:.1f}s")
+
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async def fetch(params):
+        started_at = time.perf_counter()
+        async with session.get(f"{api_url}/history/", params=params, headers=headers) as response:
+            response.raise_for_status()
+            body = await response.json()
+        return time.perf_counter() - started_at, body
+
+    first_page = []
+    for _ in range(args.history_requests):
+        latency, _ = await fetch({"framework": "FastAPI"})
+        first_page.append(latency)
+
+    pages = []
+    params = {"framework": "FastAPI"}
+    for _ in range(args.history_pages):
+        latency, body = await fetch(params)
+        pages.append(latency)
+        if not body.get("next_cursor"):
+            break
+        params = {"framework": "FastAPI", "cursor": body["next_cursor"]}
+
+    result = {
+        "rows": args.history_rows,
+        "first_page": latency_summary(first_page),
+        "cursor_pages": latency_summary(pages),
+    }
+    print(f"/history/ over {args.history_rows} rows: first page p50 {result['first_page']['p50_ms']}ms, "
+          f"cursor pages p99 {result['cursor_pages']['p99_ms']}ms")
+    return result
+
+
+async def run_api_stages(work_dir, args):
+    llm_port = free_port()
+    api_port = free_port()
+    api_url = f"http://127.0.0.1:{api_port}"
+    database_path = os.path.join(work_dir, "benchmark.db")
+
+    llm_process = start_process(
+        [sys.executable, os.path.join(BENCHMARKS_DIR, "fake_llm.py"), "--port", str(llm_port),
+         "--latency-ms", str(args.llm_latency_ms), "--tokens-per-second", str(args.llm_tokens_per_second),
+         "--answer-tokens", str(args.llm_answer_tokens)],
+        cwd=BENCHMARKS_DIR, env=os.environ.copy(), log_path=os.path.join(work_dir, "fake_llm.log")
+    )
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{llm_port}/v1",
+        "DATABASE_URL": f"sqlite:///{database_path}",
+        "CHROMA_DB_PATH": os.path.join(work_dir, "chroma_db"),
+        "EMBEDDING_CACHE_DIR": "",
+        "WARM_UP": "1",
+    }
+    if not args.answer_cache:
+        env["ANSWER_CACHE_SIZE"] = "0"
+    api_process = start_process(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(api_port)],
+        cwd=APP_DIR, env=env, log_path=os.path.join(work_dir, "api.log")
+    )
+
+    results = {}
+    try:
+        connector = aiohttp.TCPConnector(limit=max(args.concurrency + [1]))
+        timeout = aiohttp.ClientTimeout(total=600)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            await wait_until_ready(session, f"http://127.0.0.1:{llm_port}/stats", llm_process)
+            started_at = time.perf_counter()
+            await wait_until_ready(session, f"{api_url}/ready", api_process)
+            results["api_ready_seconds"] = round(time.perf_counter() - started_at, 3)
+
+            if "query" in args.stages:
+                token = await get_token(session, api_url, "query-benchmark@example.com")
+                results["query"] = [
+                    await measure_queries(session, api_url, token, concurrency, args) for concurrency in args.concurrency
+                ]
+            if "history" in args.stages:
+                results["history"] = await measure_history(session, api_url, database_path, args)
+    finally:
+        for process in (api_process, llm_process):
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    return results
+
+
+def flatten(report, prefix=""):
+    values = {}
+    if isinstance(report, dict):
+        for key, value in report.items():
+            values.update(flatten(value, f"{prefix}{key}."))
+    elif isinstance(report, list):
+        for item in report:
+            # Runs are told apart by what they vary, not by their position
+            label = ",".join(f"{key}={item[key]}" for key in ("framework", "collection_size", "concurrency") if key in item)
+            values.update(flatten(item, f"{prefix}{label}."))
+    elif isinstance(report, (int, float)) and not isinstance(report, bool):
+        values[prefix.rstrip(".")] = report
+    return values
+
+
+def compare(report, baseline):
+    current = flatten(report["results"])
+    previous = flatten(baseline["results"])
+    changes = {}
+    for key in sorted(current.keys() & previous.keys()):
+        if key.endswith(COMPARED_SUFFIXES) and previous[key]:
+            changes[key] = {
+                "baseline": previous[key],
+                "current": current[key],
+                "change_pct": round((current[key] - previous[key]) / previous[key] * 100, 1),
+            }
+    return changes
+
+
+def run(args):
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="docu-bot-benchmark-")
+    os.makedirs(work_dir, exist_ok=True)
+    report = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        },
+        "results": {},
+    }
+    try:
+        if "ingest" in args.stages or "search" in args.stages:
+            handler = ChromaDBHandler(db_path=os.path.join(work_dir, "chroma_db"), model_name=args.model, cache_dir=None)
+            try:
+                ingest_report, search_results = run_ingest_and_search(handler, args)
+            finally:
+                handler.close()
+            report["results"]["ingest"] = ingest_report
+            if search_results:
+                report["results"]["search"] = search_results
+        if "query" in args.stages or "history" in args.stages:
+            report["results"].update(asyncio.run(run_api_stages(work_dir, args)))
+    finally:
+        if not args.keep_work_dir and args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            report["comparison"] = compare(report, json.load(file))
+    return report
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run(args)
+
+    output = args.output or os.path.join(
+        BENCHMARKS_DIR, "results", f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {output}")
+
+    for key, change in report.get("comparison", {}).items():
+        print(f"{key}: {change['baseline']} -> {change['current']} ({change['change_pct']:+.1f}%)")
@@ -0,0 +1,237 @@
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import queue
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(BENCHMARKS_DIR, "..", "app")
+
+# The app modules use bare imports, as when the API runs from app/
+sys.path.insert(0, APP_DIR)
+
+from chroma_db import FRAMEWORKS  # noqa: E402
+from embedding_service import RemoteEmbeddings  # noqa: E402
+from metrics import process_memory  # noqa: E402
+from query_batcher import BatchingQueryEmbeddings  # noqa: E402
+from synthetic_corpus import generate_questions  # noqa: E402
+
+MODES = ("in_process", "preloaded", "service")
+
+MB = 1024 * 1024
+
+# Model loaded by the parent before forking the workers in preloaded mode
+_preloaded = None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Compare the memory per API worker and the query embedding latency of the embedding "
+                    "deployments: a model per worker, one model preloaded before forking, and the embedding service."
+    )
+    parser.add_argument("--modes", default=",".join(MODES), help=f"Modes to measure (default: {','.join(MODES)})")
+    parser.add_argument("--workers", type=int, default=4, help="Worker processes per mode (default: 4)")
+    parser.add_argument("--queries", type=int, default=200, help="Questions each worker embeds (default: 200)")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="Embedding model (default: all-MiniLM-L6-v2)")
+    parser.add_argument("--backend", default="torch", help="Embedding backend (default: torch)")
+    parser.add_argument("--threads", type=int, default=1,
+                        help="CPU threads per model, so the workers do not oversubscribe the CPU (default: 1)")
+    parser.add_argument("--onnx-dir", default="./onnx_models", help="Directory of the ONNX exports (default: ./onnx_models)")
+    parser.add_argument("--batch-wait-ms", type=float, default=5.0,
+                        help="Query batching window, as QUERY_BATCH_WAIT_MS (default: 5)")
+    parser.add_argument("--socket", default="/tmp/docubot-embeddings-benchmark.sock",
+                        help="Unix socket of the embedding service started for the service mode")
+    parser.add_argument("--output", default=None, help="Also write the results to this JSON file")
+    return parser.parse_args()
+
+
+def worker_questions(worker, count):
+    # Every worker embeds its own questions, so none is answered from another's LRU entries
+    frameworks = list(FRAMEWORKS)
+    per_framework = -(-count // len(frameworks))
+    questions = [question for framework in frameworks for question in generate_questions(framework, per_framework, seed=worker)]
+    return [f"{question} [worker {worker}]" for question in questions[:count]]
+
+
+# One API worker: embed its questions one at a time, the way the app does (through a query
+# batcher in front of the model or the service), then report its latencies and memory. Workers
+# stay alive until released, so the memory of each is measured while all of them are running.
+def run_worker(worker, mode, args, start, release, results):
+    started_at = time.perf_counter()
+    if mode == "service":
+        embeddings = BatchingQueryEmbeddings(RemoteEmbeddings(args.socket), max_wait_ms=0, lru_size=0)
+    else:
+        # Imported only where a model is loaded: as in the app, service mode workers never
+        # import the model's runtime, which is part of the memory they save
+        from hf_embeddings import load_embeddings
+
+        model = _preloaded if mode == "preloaded" else load_embeddings(args.model, args.backend, args.threads, args.onnx_dir)
+        embeddings = BatchingQueryEmbeddings(model, max_wait_ms=args.batch_wait_ms, lru_size=0)
+    load_seconds = time.perf_counter() - started_at
+
+    embeddings.embed_query("warm up")
+    results.put(("loaded", worker))
+    start.wait()
+    latencies = []
+    for question in worker_questions(worker, args.queries):
+        started_at = time.perf_counter()
+        embeddings.embed_query(question)
+        latencies.append(time.perf_counter() - started_at)
+
+    results.put(("done", {"worker": worker, "load_seconds": load_seconds, "latencies": latencies,
+                          "memory": process_memory()}))
+    release.wait()
+    embeddings.close()
+
+
+def collect(results, workers, kind):
+    # One message of `kind` per worker; a worker that fails before sending it stops the run
+    messages = []
+    while len(messages) < len(workers):
+        try:
+            message_kind, message = results.get(timeout=1)
+        except queue.Empty:
+            failed = [process for process in workers if process.exitcode not in (None, 0)]
+            if failed:
+                raise RuntimeError(f"{len(failed)} of the workers failed, see their errors above")
+            continue
+        if message_kind == kind:
+            messages.append(message)
+    return messages
+
+
+def start_service(args):
+    if os.path.exists(args.socket):
+        os.remove(args.socket)
+    command = [
+        sys.executable, "embedding_service.py", "--socket", args.socket, "--model", args.model, "--backend", args.backend,
+        "--threads", str(args.threads), "--onnx-dir", os.path.abspath(args.onnx_dir), "--cache-dir", "",
+        "--batch-wait-ms", str(args.batch_wait_ms), "--lru-size", "0",
+    ]
+    service = subprocess.Popen(command, cwd=APP_DIR)
+    deadline = time.monotonic() + 300
+    while time.monotonic() < deadline:
+        if service.poll() is not None:
+            raise RuntimeError(f"The embedding service exited with code {service.returncode}")
+        try:
+            RemoteEmbeddings(args.socket).service_stats()
+            return service
+        except ConnectionError:
+            time.sleep(0.2)
+    service.terminate()
+    raise RuntimeError("The embedding service did not start within 300s")
+
+
+def summarize_memory(memories):
+    return {
+        f"{kind}_mb_mean": round(float(np.mean([memory.get(kind, 0) for memory in memories])) / MB, 1)
+        for kind in ("rss", "pss", "uss")
+    }
+
+
+def measure_mode(mode, args):
+    global _preloaded
+
+    print(f"Measuring {mode} with {args.workers} workers...")
+    service = None
+    host_memory = {}
+    if mode == "preloaded":
+        from hf_embeddings import load_embeddings
+
+        # As the pre-forking server does: load before forking, and keep the model out of the
+        # garbage collector so it does not un-share its pages in the workers
+        _preloaded = load_embeddings(args.model, args.backend, args.threads, args.onnx_dir)
+        gc.freeze()
+        context = multiprocessing.get_context("fork")
+    else:
+        context = multiprocessing.get_context("spawn")
+        if mode == "service":
+            service = start_service(args)
+
+    start, release, results = context.Event(), context.Event(), context.Queue()
+    workers = [
+        context.Process(target=run_worker, args=(worker, mode, args, start, release, results))
+        for worker in range(args.workers)
+    ]
+    try:
+        for process in workers:
+            process.start()
+        collect(results, workers, "loaded")
+        started_at = time.perf_counter()
+        start.set()
+        reports = collect(results, workers, "done")
+        seconds = time.perf_counter() - started_at
+
+        # The process holding the shared model, measured while the workers are still alive
+        if mode == "preloaded":
+            host_memory = process_memory()
+        elif mode == "service":
+            host_memory = RemoteEmbeddings(args.socket).service_stats()["memory"]
+        release.set()
+        for process in workers:
+            process.join()
+    finally:
+        for process in workers:
+            if process.is_alive():
+                process.terminate()
+        if service is not None:
+            service.terminate()
+            service.wait()
+        if mode == "preloaded":
+            gc.unfreeze()
+            _preloaded = None
+
+    latencies = np.concatenate([report["latencies"] for report in reports]) * 1000
+    memories = [report["memory"] for report in reports]
+    result = {
+        "workers": args.workers,
+        "load_seconds_mean": round(float(np.mean([report["load_seconds"] for report in reports])), 3),
+        "queries_per_second": round(len(latencies) / seconds, 1),
+        "query_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "query_p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "worker_memory": summarize_memory(memories),
+        # PSS adds up to the memory the deployment really takes, shared pages counted once
+        "total_pss_mb": round((sum(memory.get("pss", 0) for memory in memories) + host_memory.get("pss", 0)) / MB, 1),
+    }
+    if host_memory:
+        result["parent_memory" if mode == "preloaded" else "service_memory"] = summarize_memory([host_memory])
+    return result
+
+
+def run(args):
+    modes = [mode for mode in args.modes.split(",") if mode]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        raise ValueError(f"Unknown modes: {', '.join(sorted(unknown))}")
+
+    report = {"model": args.model, "backend": args.backend, "threads": args.threads, "queries_per_worker": args.queries,
+              "modes": {}}
+    for mode in modes:
+        report["modes"][mode] = measure_mode(mode, args)
+
+    # Latency the shared deployments add over a model in every worker
+    baseline = report["modes"].get("in_process")
+    if baseline is not None:
+        report["added_latency_ms"] = {
+            mode: {
+                "p50": round(result["query_p50_ms"] - baseline["query_p50_ms"], 2),
+                "p95": round(result["query_p95_ms"] - baseline["query_p95_ms"], 2),
+            }
+            for mode, result in report["modes"].items() if mode != "in_process"
+        }
+    return report
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run(args)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
@@ -0,0 +1,64 @@
+import random
+
+from langchain_core.documents import Document
+
+# Identifiers mixed into each framework's synthetic docs, so chunks and questions look like
+# the real collections to both the embedding model and BM25
+FRAMEWORK_TERMS = {
+    "FastAPI": ["Depends", "APIRouter", "BackgroundTasks", "HTTPException", "response_model", "Query", "Path",
+                "BaseModel", "status_code", "middleware", "lifespan", "WebSocket", "OAuth2PasswordBearer"],
+    "Django": ["select_related", "prefetch_related", "get_object_or_404", "QuerySet", "ModelForm", "migrations",
+               "ForeignKey", "middleware", "urlpatterns", "TemplateView", "signals", "ManyToManyField"],
+    "RubyOnRails": ["has_many", "belongs_to", "before_action", "validates", "ActiveRecord", "migrations",
+                    "strong_parameters", "render", "redirect_to", "ActionCable", "routes", "scope"],
+    "Flutter": ["StatefulWidget", "StatelessWidget", "setState", "FutureBuilder", "StreamBuilder", "BuildContext",
+                "Navigator", "Provider", "ListView", "MaterialApp", "pubspec", "InheritedWidget"],
+}
+
+WORDS = (
+    "the a request response server client handler view model field query database cache route template "
+    "configure install define return raise call pass validate render update create delete list detail "
+    "when you use this to in of for with by and or value object instance class method function argument "
+    "default optional required parameter setting example error exception test state widget build async"
+).split()
+
+QUESTION_TEMPLATES = [
+    "How do I use {term} in {framework}?",
+    "What does {term} do?",
+    "When should I use {term} instead of {other}?",
+    "How can I configure {term} for a {word} {word2}?",
+    "Why does {term} raise an error with {other}?",
+]
+
+
+def _sentence(rng, terms):
+    words = rng.choices(WORDS, k=rng.randint(8, 18))
+    words.insert(rng.randrange(len(words)), rng.choice(terms))
+    return " ".join(words).capitalize() + "."
+
+
+# `count` chunks of about `chunk_size` characters for a framework, grouped into sources of
+# `chunks_per_source` chunks; the same seed always gives the same corpus
+def generate_chunks(framework, count, seed=0, chunk_size=1000, chunks_per_source=10):
+    rng = random.Random(f"{framework}:{seed}")
+    terms = FRAMEWORK_TERMS[framework]
+    for i in range(count):
+        sentences = []
+        while sum(len(sentence) + 1 for sentence in sentences) < chunk_size:
+            sentences.append(_sentence(rng, terms))
+        source = f"synthetic/{framework}/page-{i // chunks_per_source}.txt"
+        yield source, Document(page_content=f"[{framework} #{i}] " + " ".join(sentences), metadata={"source": source})
+
+
+def generate_questions(framework, count, seed=0):
+    rng = random.Random(f"{framework}:questions:{seed}")
+    terms = FRAMEWORK_TERMS[framework]
+    questions = []
+    for i in range(count):
+        template = rng.choice(QUESTION_TEMPLATES)
+        term, other = rng.sample(terms, 2)
+        question = template.format(term=term, other=other, framework=framework, word=rng.choice(WORDS),
+                                   word2=rng.choice(WORDS))
+        # Numbered so no two benchmark questions are the same text
+        questions.append(f"{question} (#{i})")
+    return questions
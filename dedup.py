@@ -0,0 +1,99 @@
+import hashlib
+import re
+from collections import Counter
+
+import numpy as np
+
+# Default estimated Jaccard similarity above which two chunks count as near-duplicates
+DEFAULT_DEDUP_THRESHOLD = 0.85
+
+# Mersenne prime 2^31 - 1; with 31-bit shingle hashes the permutations never overflow uint64
+_PRIME = np.uint64((1 << 31) - 1)
+
+
+# Split the permutations into LSH bands so that pairs around the threshold become candidates:
+# pick the band count whose S-curve midpoint (1/b)^(1/r) sits just below the threshold
+def _choose_bands(num_perm, threshold):
+    best = None
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands:
+            continue
+        rows = num_perm // bands
+        midpoint = (1 / bands) ** (1 / rows)
+        if midpoint <= threshold and (best is None or midpoint > best[0]):
+            best = (midpoint, bands, rows)
+    return best[1], best[2]
+
+
+# Drops chunks whose word shingles overlap an already kept chunk by at least `threshold`
+# (estimated Jaccard similarity) using MinHash signatures and LSH banding, so only candidate
+# pairs that share a band are ever compared
+class NearDuplicateFilter:
+    def __init__(self, threshold=DEFAULT_DEDUP_THRESHOLD, num_perm=128, shingle_size=5, seed=1):
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold must be in (0, 1]")
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+
+        rng = np.random.RandomState(seed)
+        self.perm_a = rng.randint(1, int(_PRIME), size=num_perm).astype(np.uint64)
+        self.perm_b = rng.randint(0, int(_PRIME), size=num_perm).astype(np.uint64)
+        self.bands, self.rows = _choose_bands(num_perm, threshold)
+
+        self.signatures = []
+        self.keys = []
+        self.buckets = [{} for _ in range(self.bands)]
+
+        self.checked = 0
+        self.removed = 0
+        self.removed_by_source = Counter()
+
+    def _shingles(self, text):
+        words = re.sub(r"\s+", " ", text.lower()).strip().split(" ")
+        if len(words) <= self.shingle_size:
+            return {" ".join(words)}
+        return {" ".join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+
+    def signature(self, text):
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little") >> 1
+             for shingle in self._shingles(text)),
+            dtype=np.uint64,
+        )
+        # One row per permutation: (a * h + b) mod p, minimised over the shingles
+        return ((np.outer(self.perm_a, hashes) + self.perm_b[:, None]) % _PRIME).min(axis=1)
+
+    def _band_keys(self, signature):
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def check(self, text, key, source=None):
+        # Returns the key of the kept chunk this one duplicates, or None after keeping it
+        self.checked += 1
+        signature = self.signature(text)
+        band_keys = self._band_keys(signature)
+
+        candidates = set()
+        for bucket, band_key in zip(self.buckets, band_keys):
+            candidates.update(bucket.get(band_key, ()))
+        for index in candidates:
+            if np.mean(self.signatures[index] == signature) >= self.threshold:
+                self.removed += 1
+                self.removed_by_source[source or key] += 1
+                return self.keys[index]
+
+        index = len(self.signatures)
+        self.signatures.append(signature)
+        self.keys.append(key)
+        for bucket, band_key in zip(self.buckets, band_keys):
+            bucket.setdefault(band_key, []).append(index)
+        return None
+
+    def report(self, top=10):
+        share = self.removed / self.checked if self.checked else 0.0
+        lines = [
+            f"Near-duplicate filter (threshold {self.threshold}, {self.bands}x{self.rows} LSH bands): "
+            f"removed {self.removed} of {self.checked} chunks ({share:.1%})"
+        ]
+        for source, count in self.removed_by_source.most_common(top):
+            lines.append(f"  {count} near-duplicate chunks dropped from {source}")
+        return "\n".join(lines)
@@ -1,13 +1,15 @@
-import os
 import re
 import pymupdf  # For extracting text from PDF using pymupdf
 import unicodedata
 import chromadb
 from langchain.text_splitter import CharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+from ingest import load_embedding_model, make_ingestor, open_collection, ordered_map, parse_ingest_args, publish_rebuild
+
+# Number of PDF pages extracted by one worker task in parallel mode
+PAGES_PER_TASK = 32
+
 # # Function to clean text (same as before)
 # def clean_scraped_content(content):
 #     # Remove extra newlines and whitespace
@@ -15,64 +17,93 @@ from langchain_text_splitters import RecursiveCharacterTextSplitter
 #     # Optional: Add specific rules for unnecessary blocks if needed
 #     return content
 
-# Extract text from a PDF file using pymupdf
-def extract_text_from_pdf(pdf_path):
-    extracted_text = ""
-    doc = pymupdf.open(pdf_path)  # Open the PDF file
-    for page in doc:  # Iterate over each page
-        extracted_text += page.get_text()  # Get text from each page
-    return extracted_text
-
-# Initialize ChromaDB Persistent Client
-print("Initializing ChromaDB Persistent Client...")
-client = chromadb.PersistentClient(path="./chroma_db")
-print("ChromaDB Persistent Client initialized.")
-
-# Define LangChain text splitter
-print("Defining LangChain text splitter...")
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1024,  # Size of each chunk in characters
-    chunk_overlap=100,  # Overlap between consecutive chunks
-    length_function=len,  # Function to compute the length of the text
-)
-print("Text splitter defined.")
-
-# Initialize Hugging Face model for embeddings (all-MiniLM-L6-v2)
-print("Initializing SentenceTransformer model for embeddings...")
-embedding_model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-print("SentenceTransformer model initialized.")
-
-# Initialize Chroma DB in LangChain, connecting it to the PersistentClient
-print("Initializing Chroma VectorStore...")
-vectorstore = Chroma(
-    collection_name="Django",
-    embedding_function=embedding_model,
-    client=client
-)
-print("Chroma VectorStore initialized.")
-
-# Specify the path to the Django documentation PDF
-pdf_path = 'django.pdf'
-
-# Extract and process the PDF text using pymupdf
-print(f"Extracting text from PDF: {pdf_path}")
-pdf_text = extract_text_from_pdf(pdf_path)
-print(f"Text extracted from PDF. Length: {len(pdf_text)} characters")
-
-# Clean the extracted text
-cleaned_text = pdf_text
-print(f"Cleaned text. Length: {len(cleaned_text)} characters")
-
-# Split text into smaller documents using LangChain's CharacterTextSplitter
-print("Splitting text into smaller chunks...")
-docs = text_splitter.create_documents([cleaned_text])
-print(f"Number of document chunks created: {len(docs)}")
-
-# Store each document chunk in Chroma DB
-print("Storing document chunks in ChromaDB...")
-for doc in docs:
-    metadata = {"source": "Django PDF"}
-    vectorstore.add_texts([doc.page_content], metadatas=[metadata])
-
-# Automatically persist the Chroma database due to PersistentClient
-print("Data persisted successfully after processing the PDF.")
+# Extract the (page number, text) pairs of pages [start, end) of a PDF file using pymupdf
+def extract_page_range(pdf_path, start, end):
+    with pymupdf.open(pdf_path) as doc:  # Open the PDF file
+        return [(page_index + 1, doc[page_index].get_text()) for page_index in range(start, end)]
+
+
+# Stream (page number, text) pairs of a PDF in page order instead of building the whole text.
+# With more than one worker, page ranges are extracted in a process pool.
+def iter_pdf_pages(pdf_path, workers=1):
+    if workers <= 1:
+        with pymupdf.open(pdf_path) as doc:
+            for page in doc:  # Iterate over each page
+                yield page.number + 1, page.get_text()
+        return
+
+    with pymupdf.open(pdf_path) as doc:
+        page_count = doc.page_count
+    page_ranges = [
+        (pdf_path, start, min(start + PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, PAGES_PER_TASK)
+    ]
+    for pages in ordered_map(extract_page_range, page_ranges, workers):
+        yield from pages
+
+
+if __name__ == "__main__":
+    args = parse_ingest_args("Index django.pdf into the Django ChromaDB collection.")
+
+    # Initialize ChromaDB Persistent Client
+    print("Initializing ChromaDB Persistent Client...")
+    client = chromadb.PersistentClient(path="./chroma_db")
+    print("ChromaDB Persistent Client initialized.")
+
+    # Define LangChain text splitter
+    print("Defining LangChain text splitter...")
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1024,  # Size of each chunk in characters
+        chunk_overlap=100,  # Overlap between consecutive chunks
+        length_function=len,  # Function to compute the length of the text
+        add_start_index=True,  # Record each chunk's offset so overlapping chunks can be merged at query time
+    )
+    print("Text splitter defined.")
+
+    # Initialize Hugging Face model for embeddings (all-MiniLM-L6-v2)
+    print("Initializing SentenceTransformer model for embeddings...")
+    embedding_model = load_embedding_model(args, "all-MiniLM-L6-v2")
+    print("SentenceTransformer model initialized.")
+
+    # Initialize the batched ingestion stage for the Django collection
+    print("Initializing batched ingestion...")
+    collection, manifest = open_collection(args, client, "./chroma_db", "Django")
+    ingestor = make_ingestor(args, collection, embedding_model, manifest)
+    print(f"Batched ingestion initialized with batch size {args.batch_size} (incremental: {args.incremental}, workers: {args.workers}).")
+
+    # Chunks indexed before page-level tracking carry no page number and would never be replaced
+    if not manifest.entries:
+        legacy = collection.get(where={"source": "Django PDF"}, include=["metadatas"])
+        legacy_ids = [chunk_id for chunk_id, metadata in zip(legacy["ids"], legacy["metadatas"]) if "page" not in metadata]
+        if legacy_ids:
+            collection.delete(ids=legacy_ids)
+            print(f"Removed {len(legacy_ids)} chunks indexed without page numbers.")
+
+    # Specify the path to the Django documentation PDF
+    pdf_path = 'django.pdf'
+
+    # Stream pages out of the PDF with pymupdf; each page is split and queued for embedding
+    # as soon as it arrives, so memory stays flat and the first batches are stored right away
+    print(f"Extracting text from PDF: {pdf_path} ({args.workers} extraction processes)")
+    for page_number, page_text in iter_pdf_pages(pdf_path, workers=args.workers):
+        metadata = {"source": "Django PDF", "page": page_number}
+        source_key = f"{pdf_path}#page={page_number}"
+
+        # Skip pages whose content has not changed since the last run
+        if ingestor.is_unchanged(source_key, page_text, metadata):
+            continue
+
+        # Clean the extracted text
+        cleaned_text = page_text
+
+        # Split text into smaller documents using LangChain's RecursiveCharacterTextSplitter
+        docs = text_splitter.create_documents([cleaned_text])
+        ingestor.add_documents(docs, metadata, source_key=source_key)
+
+    ingestor.finish()
+
+    # Automatically persist the Chroma database due to PersistentClient
+    print("Data persisted successfully after processing the PDF.")
+
+    # With --rebuild, validate the new version and swap it in for the API
+    publish_rebuild(args, client, "./chroma_db", collection)
@@ -1,71 +1,48 @@
-import os
 import re
 import unicodedata
 import chromadb
 from langchain.text_splitter import CharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-# Initialize ChromaDB Persistent Client
-print("Initializing ChromaDB Persistent Client...")
-client = chromadb.PersistentClient(path="./chroma_db")
-print("ChromaDB Persistent Client initialized.")
+from ingest import ingest_folder, load_embedding_model, make_ingestor, open_collection, parse_ingest_args, publish_rebuild
 
-# Directory containing the scraped documentation files
-docs_folder = 'Flutter-Docs'
 
-# Define LangChain text splitter
-print("Defining LangChain text splitter...")
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1024, # Size of each chunk in characters
-    chunk_overlap=100, # Overlap between consecutive chunks
-    length_function=len, # Function to compute the length of the text
-  )
-print("Text splitter defined.")
+if __name__ == "__main__":
+    args = parse_ingest_args("Index the scraped Flutter-Docs into the Flutter ChromaDB collection.")
 
-# Initialize Hugging Face model for embeddings (all-MiniLM-L6-v2)
-print("Initializing SentenceTransformer model for embeddings...")
-embedding_model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-print("SentenceTransformer model initialized.")
+    # Initialize ChromaDB Persistent Client
+    print("Initializing ChromaDB Persistent Client...")
+    client = chromadb.PersistentClient(path="./chroma_db")
+    print("ChromaDB Persistent Client initialized.")
 
-# Initialize Chroma DB in LangChain, connecting it to the PersistentClient
-print("Initializing Chroma VectorStore...")
-vectorstore = Chroma(
-    collection_name="Flutter",
-    embedding_function=embedding_model,
-    client=client
-)
-print("Chroma VectorStore initialized.")
+    # Directory containing the scraped documentation files
+    docs_folder = 'Flutter-Docs'
 
-# Iterate over each file in the FastAPI-Docs folder
-for filename in os.listdir(docs_folder):
-    file_path = os.path.join(docs_folder, filename)
+    # Define LangChain text splitter
+    print("Defining LangChain text splitter...")
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1024, # Size of each chunk in characters
+        chunk_overlap=100, # Overlap between consecutive chunks
+        length_function=len, # Function to compute the length of the text
+        add_start_index=True, # Record each chunk's offset so overlapping chunks can be merged at query time
+      )
+    print("Text splitter defined.")
 
-    # Process only text files
-    if filename.endswith('.txt'):
-        print(f"Reading file: {filename}")
-        with open(file_path, 'r', encoding='utf-8') as file:
-            raw_text = file.read()
+    # Initialize Hugging Face model for embeddings (all-MiniLM-L6-v2)
+    print("Initializing SentenceTransformer model for embeddings...")
+    embedding_model = load_embedding_model(args, "all-MiniLM-L6-v2")
+    print("SentenceTransformer model initialized.")
 
-        print(f"File read successfully. Length of raw text: {len(raw_text)} characters")
+    # Initialize the batched ingestion stage for the Flutter collection
+    print("Initializing batched ingestion...")
+    collection, manifest = open_collection(args, client, "./chroma_db", "Flutter")
+    ingestor = make_ingestor(args, collection, embedding_model, manifest)
+    print(f"Batched ingestion initialized with batch size {args.batch_size} (incremental: {args.incremental}, workers: {args.workers}).")
 
-        # Clean the text
-        cleaned_text = raw_text
-        print(f"Cleaned text. Length of cleaned text: {len(cleaned_text)} characters")
+    # Read, clean and split every file and store the chunks in Chroma DB;
+    # Chroma persists automatically due to PersistentClient
+    ingest_folder(ingestor, docs_folder, text_splitter, clean_fn=None, workers=args.workers)
+    print("All files processed and data persisted.")
 
-        # Split text into smaller documents using LangChain's CharacterTextSplitter
-        print("Splitting text into smaller chunks...")
-        docs = text_splitter.create_documents([cleaned_text])
-        print(f"Number of document chunks created: {len(docs)}")
-
-        # Store each document chunk in Chroma DB
-        print("Storing document chunks in ChromaDB...")
-        for doc in docs:
-            metadata = {"source": filename}
-            vectorstore.add_texts([doc.page_content], metadatas=[metadata])
-
-        # Automatically persist the Chroma database due to PersistentClient
-        print(f"Data persisted successfully after processing {filename}")
-
-print("All files processed and data persisted.")
+    # With --rebuild, validate the new version and swap it in for the API
+    publish_rebuild(args, client, "./chroma_db", collection)
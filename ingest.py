@@ -0,0 +1,690 @@
+import argparse
+import hashlib
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from app.bm25 import BM25Index, bm25_index_path
+from app.embedding_cache import DEFAULT_CACHE_SIZE_MB, CachedEmbeddings
+from app.hf_embeddings import EMBEDDING_BACKENDS, embedding_cache_name, load_embeddings
+from app.index_state import (
+    activate_collection,
+    active_collection_name,
+    bump_generation,
+    collection_version,
+    logical_collection_name,
+    read_index_state,
+    reserve_version,
+    versioned_collection_name,
+)
+from dedup import DEFAULT_DEDUP_THRESHOLD, NearDuplicateFilter
+
+# Number of chunks embedded and written to Chroma in one go
+DEFAULT_BATCH_SIZE = 256
+
+# Number of batches allowed to wait for the embedding worker and for the writer
+DEFAULT_QUEUE_SIZE = 4
+
+# Number of chunks read back from Chroma per request when rebuilding the BM25 index
+BM25_READ_BATCH = 5000
+
+# Rebuild validation: chunks whose own vector must find them, and the smallest size of the
+# rebuilt collection relative to the one it replaces
+DEFAULT_VALIDATION_SAMPLES = 20
+DEFAULT_MIN_COUNT_RATIO = 0.8
+
+# Distance under which a sampled chunk counts as found by its own vector
+SELF_MATCH_DISTANCE = 1e-3
+
+
+# Command line options shared by all the *_doc.py loaders
+def parse_ingest_args(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f"Number of chunks embedded and upserted per batch (default: {DEFAULT_BATCH_SIZE})",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Skip sources whose content hash is unchanged and only embed new chunks",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Processes reading, cleaning and splitting files; above 1, embedding and writing "
+        "also run in their own pipeline stages (default: 1)",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=DEFAULT_QUEUE_SIZE,
+        help=f"Batches buffered between pipeline stages before readers are held back (default: {DEFAULT_QUEUE_SIZE})",
+    )
+    parser.add_argument(
+        "--embedding-cache",
+        default="./embedding_cache",
+        help="Directory of the persistent embedding cache (default: ./embedding_cache)",
+    )
+    parser.add_argument(
+        "--embedding-cache-size",
+        type=float,
+        default=DEFAULT_CACHE_SIZE_MB,
+        help=f"Size budget of the embedding cache in MB, applied when the cache is first created "
+             f"(default: {DEFAULT_CACHE_SIZE_MB})",
+    )
+    parser.add_argument(
+        "--no-embedding-cache",
+        action="store_true",
+        help="Always run the embedding model instead of consulting the cache",
+    )
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="Drop near-duplicate chunks (MinHash/LSH) before they are embedded; near-duplicates "
+        "are only detected among the sources processed in the same run, so it needs a full run",
+    )
+    parser.add_argument(
+        "--dedup-threshold",
+        type=float,
+        default=DEFAULT_DEDUP_THRESHOLD,
+        help=f"Estimated Jaccard similarity above which chunks are near-duplicates (default: {DEFAULT_DEDUP_THRESHOLD})",
+    )
+    parser.add_argument(
+        "--embedding-backend",
+        choices=EMBEDDING_BACKENDS,
+        default="torch",
+        help="Run the embedding model with sentence-transformers (torch) or ONNX Runtime, as is (onnx) "
+        "or with int8 weights (onnx-int8) (default: torch)",
+    )
+    parser.add_argument(
+        "--embedding-threads",
+        type=int,
+        default=None,
+        help="CPU threads of the embedding model (default: chosen by the backend)",
+    )
+    parser.add_argument(
+        "--onnx-dir",
+        default="./onnx_models",
+        help="Directory of the ONNX exports, made on first use (default: ./onnx_models)",
+    )
+    parser.add_argument(
+        "--no-bm25",
+        action="store_true",
+        help="Do not build or update the collection's BM25 index used by hybrid retrieval",
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Index everything into a new version of the collection while the API keeps serving the current "
+        "one, then validate it and swap it in",
+    )
+    parser.add_argument(
+        "--keep-versions",
+        type=int,
+        default=1,
+        help="With --rebuild, previous versions kept after the swap, at least 1 so API workers can keep "
+        "serving the one they switch from; older ones are deleted (default: 1)",
+    )
+    parser.add_argument(
+        "--validation-samples",
+        type=int,
+        default=DEFAULT_VALIDATION_SAMPLES,
+        help=f"With --rebuild, chunks that must be found by their own vector before the swap (default: {DEFAULT_VALIDATION_SAMPLES})",
+    )
+    parser.add_argument(
+        "--min-count-ratio",
+        type=float,
+        default=DEFAULT_MIN_COUNT_RATIO,
+        help="With --rebuild, smallest size of the new version relative to the one it replaces "
+        f"(default: {DEFAULT_MIN_COUNT_RATIO})",
+    )
+    args = parser.parse_args()
+    if args.rebuild and args.incremental:
+        parser.error("--rebuild indexes everything into a new collection and cannot be --incremental")
+    if args.keep_versions < 1:
+        parser.error("--keep-versions must be at least 1: API workers serve the previous version until they switch")
+    if args.dedup and args.incremental:
+        # An unchanged source skipped by the run may hold the only copy of a chunk dropped from
+        # a changed one, or lose the copy its own dropped chunk relied on
+        parser.error("--dedup only compares the sources processed in the same run and cannot be --incremental")
+    return args
+
+
+# Load the embedding model on the chosen backend, behind the persistent embedding cache unless it is disabled
+def load_embedding_model(args, model_name):
+    embedding_model = load_embeddings(model_name, args.embedding_backend, args.embedding_threads, args.onnx_dir)
+    if args.no_embedding_cache:
+        return embedding_model
+    return CachedEmbeddings(
+        embedding_model,
+        embedding_cache_name(model_name, args.embedding_backend),
+        args.embedding_cache,
+        max_size_mb=args.embedding_cache_size
+    )
+
+
+# The collection a loader writes to, with its manifest: the version the API serves, or with
+# --rebuild a new, empty version that only replaces it in publish_rebuild
+def open_collection(args, client, db_path, collection_name):
+    if args.rebuild:
+        version_name = versioned_collection_name(collection_name, reserve_version(db_path, collection_name))
+        collection = client.create_collection(name=version_name, embedding_function=None)
+        print(f"Rebuilding {collection_name} into the new collection {version_name}")
+    else:
+        version_name = active_collection_name(read_index_state(db_path), collection_name)
+        collection = client.get_or_create_collection(name=version_name, embedding_function=None)
+    return collection, IngestManifest(db_path, version_name)
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# Deterministic chunk IDs derived from the source key and the chunk content.
+# Identical chunks within one source are told apart by their occurrence number.
+def make_chunk_ids(source_key, texts):
+    seen = {}
+    ids = []
+    for text in texts:
+        occurrence = seen.get(text, 0)
+        seen[text] = occurrence + 1
+        digest = hashlib.sha256(f"{source_key}\0{occurrence}\0{text}".encode("utf-8"))
+        ids.append(digest.hexdigest()[:32])
+    return ids
+
+
+# Build a Chroma `where` filter matching every key/value in the metadata
+def metadata_filter(metadata):
+    clauses = [{key: value} for key, value in metadata.items()]
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
+
+
+# Per-collection record of the content hash and metadata filter of every indexed source
+class IngestManifest:
+    def __init__(self, db_path, collection_name):
+        self.db_path = db_path
+        self.path = os.path.join(db_path, "manifests", f"{collection_name}.json")
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as file:
+                self.entries = json.load(file)
+
+    def save(self):
+        # Write to a temporary file first so an interrupted run never leaves a torn manifest
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self.entries, file, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+# Collects chunks across files and writes them to a Chroma collection in batches,
+# so every batch pays for a single embedding forward pass and a single upsert
+class BatchIngestor:
+    def __init__(self, collection, embedding_model, batch_size=DEFAULT_BATCH_SIZE, manifest=None, incremental=False,
+                 dedup=None, bm25=True, publish=True):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        if incremental and manifest is None:
+            raise ValueError("incremental ingestion requires a manifest")
+
+        self.collection = collection
+        self.embedding_model = embedding_model
+        self.batch_size = batch_size
+        self.manifest = manifest
+        self.incremental = incremental
+        self.dedup = dedup
+        self.bm25 = bm25
+        self.publish = publish
+
+        self.pending_ids = []
+        self.pending_texts = []
+        self.pending_metadatas = []
+        self.pending_deletes = []
+
+        # Manifest entries of the sources seen in this run, saved once their chunks are written
+        self.seen_sources = {}
+
+        # Chunks written and deleted by an incremental run, to update the BM25 index with
+        self.written_chunks = {}
+        self.deleted_ids = set()
+
+        self.total_chunks = 0
+        self.skipped_sources = 0
+        self.skipped_chunks = 0
+        self.deleted_chunks = 0
+        self.total_batches = 0
+        self.embed_seconds = 0.0
+        self.write_seconds = 0.0
+        self.started_at = time.perf_counter()
+
+    def is_unchanged(self, source_key, raw_text, metadata):
+        # Record the source's hash and report whether it can be skipped in incremental mode
+        return self.record_source(source_key, content_hash(raw_text), metadata)
+
+    def record_source(self, source_key, digest, metadata):
+        self.seen_sources[source_key] = {"hash": digest, "where": metadata_filter(metadata)}
+
+        if self.incremental and self.known_hash(source_key) == digest:
+            self.skipped_sources += 1
+            return True
+        return False
+
+    def known_hash(self, source_key):
+        # Hash of the source as of the last run, or None when everything is re-indexed
+        if not self.incremental:
+            return None
+        return self.manifest.entries.get(source_key, {}).get("hash")
+
+    def add_documents(self, docs, metadata, source_key=None):
+        # Queue the chunks of one source, flushing whenever a full batch is ready
+        source_key = source_key or metadata["source"]
+        texts = [doc.page_content for doc in docs]
+        ids = make_chunk_ids(source_key, texts)
+
+        # Drop near-duplicates of chunks kept earlier in this run before anything is embedded
+        kept = []
+        for chunk_id, doc in zip(ids, docs):
+            if self.dedup is not None and self.dedup.check(doc.page_content, chunk_id, source=source_key):
+                continue
+            kept.append((chunk_id, doc))
+
+        # Chunks of this source already in the collection that are no longer kept are stale
+        existing_ids = set(self.collection.get(where=metadata_filter(metadata), include=[])["ids"])
+        self.pending_deletes.extend(existing_ids - {chunk_id for chunk_id, _ in kept})
+
+        queued = set()
+        for chunk_id, doc in kept:
+            # Unchanged chunks keep their existing embedding in incremental mode
+            if self.incremental and chunk_id in existing_ids:
+                self.skipped_chunks += 1
+                continue
+            if chunk_id in queued:
+                continue
+            queued.add(chunk_id)
+
+            self.pending_ids.append(chunk_id)
+            self.pending_texts.append(doc.page_content)
+            self.pending_metadatas.append({**doc.metadata, **metadata})
+            if len(self.pending_texts) >= self.batch_size:
+                self.flush()
+
+    def _take_batch(self):
+        batch = (self.pending_ids, self.pending_texts, self.pending_metadatas, self.pending_deletes)
+        self.pending_ids, self.pending_texts, self.pending_metadatas, self.pending_deletes = [], [], [], []
+        return batch
+
+    def flush(self):
+        if not self.pending_texts and not self.pending_deletes:
+            return
+        ids, texts, metadatas, stale_ids = self._take_batch()
+        embeddings = self._embed(texts)
+        self._write(ids, texts, embeddings, metadatas, stale_ids)
+
+    def _embed(self, texts):
+        # Embed the whole batch in one forward pass
+        if not texts:
+            return []
+        embed_start = time.perf_counter()
+        embeddings = self.embedding_model.embed_documents(texts)
+        self.embed_seconds += time.perf_counter() - embed_start
+        return embeddings
+
+    def _write(self, ids, texts, embeddings, metadatas, stale_ids):
+        write_start = time.perf_counter()
+        if texts:
+            # Write the whole batch in one Chroma round trip
+            self.collection.upsert(
+                ids=ids,
+                embeddings=embeddings,
+                documents=texts,
+                metadatas=metadatas,
+            )
+
+        # Drop stale chunks only once fresh ones are being written, never ahead of them
+        if stale_ids:
+            self.collection.delete(ids=stale_ids)
+            self.deleted_chunks += len(stale_ids)
+        self._track_changes(ids, texts, stale_ids)
+        write_end = time.perf_counter()
+        self.write_seconds += write_end - write_start
+
+        if not texts:
+            return
+        self.total_chunks += len(texts)
+        self.total_batches += 1
+        batch_rate = len(texts) / max(write_end - write_start, 1e-9)
+        print(
+            f"Stored batch {self.total_batches} ({len(texts)} chunks) in "
+            f"{write_end - write_start:.2f}s - {batch_rate:.1f} chunks/sec written, "
+            f"{self.total_chunks / max(write_end - self.started_at, 1e-9):.1f} chunks/sec overall"
+        )
+
+    def _delete_removed_sources(self):
+        # Drop the chunks of sources that were indexed before but no longer exist
+        for source_key, entry in self.manifest.entries.items():
+            if source_key in self.seen_sources:
+                continue
+            stale_ids = self.collection.get(where=entry["where"], include=[])["ids"]
+            if stale_ids:
+                self.collection.delete(ids=stale_ids)
+                self.deleted_chunks += len(stale_ids)
+                self._track_changes([], [], stale_ids)
+            print(f"Removed {len(stale_ids)} chunks of deleted source {source_key}")
+
+    def _track_changes(self, ids, texts, stale_ids):
+        # Only incremental runs update the BM25 index in place; the others rebuild it
+        if not self.incremental:
+            return
+        for chunk_id, text in zip(ids, texts):
+            self.written_chunks[chunk_id] = text
+            self.deleted_ids.discard(chunk_id)
+        for chunk_id in stale_ids:
+            self.written_chunks.pop(chunk_id, None)
+            self.deleted_ids.add(chunk_id)
+
+    def _update_bm25_index(self, path):
+        # Merge this run's written and deleted chunks into the existing index, so an incremental
+        # run costs about the size of its changes. An index that does not add up to the
+        # collection (e.g. after a run with --no-bm25) is rebuilt instead.
+        started_at = time.perf_counter()
+        index = BM25Index.load(path).update(self.deleted_ids, list(self.written_chunks), list(self.written_chunks.values()))
+        if len(index.ids) != self.collection.count():
+            print(f"The BM25 index {path} is out of date with the collection, rebuilding it")
+            self._build_bm25_index(path)
+            return
+        index.save(path)
+        print(
+            f"Updated the BM25 index with {len(self.written_chunks)} written and {len(self.deleted_ids)} deleted "
+            f"chunks in {time.perf_counter() - started_at:.2f}s: {path} ({len(index.ids)} chunks, {len(index.vocab)} terms)"
+        )
+
+    def _build_bm25_index(self, path):
+        # Rebuilt from the whole collection, so it also reflects chunks kept or deleted by this run
+        started_at = time.perf_counter()
+        ids, texts = [], []
+        while True:
+            batch = self.collection.get(include=["documents"], limit=BM25_READ_BATCH, offset=len(ids))
+            ids.extend(batch["ids"])
+            texts.extend(batch["documents"])
+            if len(batch["ids"]) < BM25_READ_BATCH:
+                break
+        index = BM25Index.build(ids, texts)
+        index.save(path)
+        print(
+            f"Built the BM25 index of {len(ids)} chunks ({len(index.vocab)} terms) in "
+            f"{time.perf_counter() - started_at:.2f}s: {path} ({os.path.getsize(path) / 1024:.0f} KB)"
+        )
+
+    def drain(self):
+        # Batches are written synchronously, so nothing is ever in flight
+        pass
+
+    def finish(self):
+        # Write out the last partial batch and print the throughput summary
+        self.flush()
+        self.drain()
+        if self.manifest is not None:
+            self._delete_removed_sources()
+            self.manifest.entries = self.seen_sources
+            self.manifest.save()
+
+            changed = self.total_chunks or self.deleted_chunks
+            bm25_path = bm25_index_path(self.manifest.db_path, self.collection.name)
+            if self.bm25 and changed and self.incremental and os.path.exists(bm25_path):
+                self._update_bm25_index(bm25_path)
+            elif self.bm25 and (changed or not os.path.exists(bm25_path)):
+                self._build_bm25_index(bm25_path)
+
+            # Tell the API that answers built from the old contents of this collection are stale;
+            # a rebuilt version is published by publish_rebuild instead, once it is validated
+            if changed and self.publish:
+                collection_name = logical_collection_name(self.collection.name)
+                generation = bump_generation(self.manifest.db_path, collection_name)
+                print(f"Collection {collection_name} is now at index generation {generation}")
+        self.report()
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started_at
+        rate = self.total_chunks / max(elapsed, 1e-9)
+        print(
+            f"Ingested {self.total_chunks} chunks in {self.total_batches} batches "
+            f"(batch size {self.batch_size}) in {elapsed:.2f}s - {rate:.1f} chunks/sec "
+            f"[embedding {self.embed_seconds:.2f}s, writing {self.write_seconds:.2f}s]"
+        )
+        if self.skipped_sources or self.skipped_chunks or self.deleted_chunks:
+            print(
+                f"Skipped {self.skipped_sources} unchanged sources and {self.skipped_chunks} "
+                f"unchanged chunks, deleted {self.deleted_chunks} stale chunks"
+            )
+        if self.dedup is not None:
+            print(self.dedup.report())
+        if isinstance(self.embedding_model, CachedEmbeddings):
+            print(self.embedding_model.cache_report())
+
+
+# Pipelined variant of BatchIngestor: full batches go through a bounded queue to a single
+# embedding worker, and from there through a second bounded queue to a single Chroma writer.
+# A full queue blocks the producer, which keeps memory flat when embedding is the bottleneck.
+class PipelinedIngestor(BatchIngestor):
+    def __init__(self, collection, embedding_model, queue_size=DEFAULT_QUEUE_SIZE, **kwargs):
+        super().__init__(collection, embedding_model, **kwargs)
+        if queue_size < 1:
+            raise ValueError("queue_size must be at least 1")
+
+        self.embed_queue = queue.Queue(maxsize=queue_size)
+        self.write_queue = queue.Queue(maxsize=queue_size)
+        self.worker_error = None
+
+        self.embed_thread = threading.Thread(target=self._embed_worker, name="embedding-worker", daemon=True)
+        self.write_thread = threading.Thread(target=self._write_worker, name="chroma-writer", daemon=True)
+        self.embed_thread.start()
+        self.write_thread.start()
+
+    def flush(self):
+        self._raise_worker_error()
+        if not self.pending_texts and not self.pending_deletes:
+            return
+        self.embed_queue.put(self._take_batch())
+
+    def _embed_worker(self):
+        while True:
+            batch = self.embed_queue.get()
+            if batch is None:
+                self.write_queue.put(None)
+                return
+            # After a failure keep consuming so the producer never blocks on a full queue
+            if self.worker_error is not None:
+                continue
+            ids, texts, metadatas, stale_ids = batch
+            try:
+                embeddings = self._embed(texts)
+            except Exception as e:
+                self.worker_error = e
+                continue
+            self.write_queue.put((ids, texts, embeddings, metadatas, stale_ids))
+
+    def _write_worker(self):
+        while True:
+            batch = self.write_queue.get()
+            if batch is None:
+                return
+            if self.worker_error is not None:
+                continue
+            try:
+                self._write(*batch)
+            except Exception as e:
+                self.worker_error = e
+
+    def _raise_worker_error(self):
+        if self.worker_error is not None:
+            raise RuntimeError("Ingestion pipeline stage failed") from self.worker_error
+
+    def drain(self):
+        # Let both stages finish every queued batch before the manifest is saved
+        self.embed_queue.put(None)
+        self.embed_thread.join()
+        self.write_thread.join()
+        self._raise_worker_error()
+
+
+# Pick the serial or pipelined ingestion stage from the command line options
+def make_ingestor(args, collection, embedding_model, manifest):
+    options = {
+        "batch_size": args.batch_size,
+        "manifest": manifest,
+        "incremental": args.incremental,
+        "dedup": NearDuplicateFilter(args.dedup_threshold) if args.dedup else None,
+        "bm25": not args.no_bm25,
+        "publish": not args.rebuild,
+    }
+    if args.workers > 1:
+        return PipelinedIngestor(collection, embedding_model, queue_size=args.queue_size, **options)
+    return BatchIngestor(collection, embedding_model, **options)
+
+
+def _collection_names(client):
+    # list_collections gives names on recent chromadb versions, collections on older ones
+    return [getattr(collection, "name", collection) for collection in client.list_collections()]
+
+
+# Reasons a rebuilt collection must not replace the one being served, if any
+def validate_rebuild(args, client, collection, previous_name, db_path):
+    problems = []
+    count = collection.count()
+    previous_count = client.get_collection(previous_name).count() if previous_name in _collection_names(client) else 0
+    if count == 0:
+        problems.append("it is empty")
+    elif count < args.min_count_ratio * previous_count:
+        problems.append(f"it has {count} chunks, fewer than {args.min_count_ratio:.0%} of the {previous_count} served now")
+
+    # Chunks sampled from the new collection must come back as their own nearest neighbour
+    samples = min(args.validation_samples, count)
+    if samples:
+        sample = collection.get(limit=samples, offset=random.randrange(count - samples + 1), include=["embeddings"])
+        result = collection.query(query_embeddings=sample["embeddings"], n_results=1, include=["distances"])
+        misses = sum(1 for distances in result["distances"] if not distances or distances[0] > SELF_MATCH_DISTANCE)
+        if misses:
+            problems.append(f"{misses} of {samples} sampled chunks were not found by their own vector")
+
+    if not args.no_bm25 and not os.path.exists(bm25_index_path(db_path, collection.name)):
+        problems.append("its BM25 index was not built")
+    return problems
+
+
+def drop_collection(client, db_path, version_name):
+    # Delete a collection version along with its manifest and BM25 index
+    client.delete_collection(version_name)
+    for path in (os.path.join(db_path, "manifests", f"{version_name}.json"), bm25_index_path(db_path, version_name)):
+        if os.path.exists(path):
+            os.remove(path)
+    print(f"Deleted collection {version_name}")
+
+
+# Delete the versions of a collection older than the one served, but the newest `keep` of them.
+# Versions newer than the served one may still be being built and are left alone.
+def collect_old_versions(client, db_path, collection_name, keep):
+    active_version = collection_version(collection_name, active_collection_name(read_index_state(db_path), collection_name))
+    old_versions = []
+    for name in _collection_names(client):
+        version = collection_version(collection_name, name)
+        if version is not None and version < active_version:
+            old_versions.append((version, name))
+    for _, name in sorted(old_versions)[:max(len(old_versions) - keep, 0)]:
+        drop_collection(client, db_path, name)
+
+
+# With --rebuild, swap the rebuilt collection in for the API once it passes validation, and
+# garbage-collect the old versions. API workers notice the swap on their next query and move
+# over once the new version is warmed up. A version failing validation is deleted and the
+# served one stays as it is.
+def publish_rebuild(args, client, db_path, collection):
+    if not args.rebuild:
+        return
+    collection_name = logical_collection_name(collection.name)
+    previous_name = active_collection_name(read_index_state(db_path), collection_name)
+    problems = validate_rebuild(args, client, collection, previous_name, db_path)
+    if problems:
+        drop_collection(client, db_path, collection.name)
+        raise SystemExit(
+            f"Rebuilt collection {collection.name} failed validation ({'; '.join(problems)}), "
+            f"{collection_name} is still served from {previous_name}"
+        )
+
+    previous_name, generation = activate_collection(db_path, collection_name, collection.name)
+    print(f"{collection_name} is now served from {collection.name} at index generation {generation} "
+          f"(was {previous_name})")
+    collect_old_versions(client, db_path, collection_name, args.keep_versions)
+
+
+# Splitter and cleaning function installed once in every reader process
+_worker_splitter = None
+_worker_clean_fn = None
+
+
+def _init_reader(text_splitter, clean_fn):
+    global _worker_splitter, _worker_clean_fn
+    _worker_splitter = text_splitter
+    _worker_clean_fn = clean_fn
+
+
+# Read, clean and split one file. Returns its content hash and chunks, or no chunks when
+# the hash matches the one recorded by the previous run.
+def prepare_file(file_path, known_hash):
+    with open(file_path, "r", encoding="utf-8") as file:
+        raw_text = file.read()
+
+    digest = content_hash(raw_text)
+    if digest == known_hash:
+        return digest, None
+
+    cleaned_text = _worker_clean_fn(raw_text) if _worker_clean_fn else raw_text
+    return digest, _worker_splitter.create_documents([cleaned_text])
+
+
+# Run fn over the argument tuples in a process pool and yield the results in input order.
+# At most two tasks per worker are in flight, so a slow consumer holds the readers back.
+def ordered_map(fn, arg_tuples, workers, initializer=None, initargs=()):
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as pool:
+        in_flight = deque()
+        for fn_args in arg_tuples:
+            in_flight.append(pool.submit(fn, *fn_args))
+            if len(in_flight) >= workers * 2:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+# Index every .txt file of a scraped docs folder, reading, cleaning and splitting the files
+# in a process pool when more than one worker is requested
+def ingest_folder(ingestor, docs_folder, text_splitter, clean_fn=None, workers=1):
+    filenames = sorted(filename for filename in os.listdir(docs_folder) if filename.endswith(".txt"))
+    print(f"Found {len(filenames)} files in {docs_folder} ({workers} reader processes)")
+
+    tasks = [(os.path.join(docs_folder, filename), ingestor.known_hash(filename)) for filename in filenames]
+    if workers <= 1:
+        _init_reader(text_splitter, clean_fn)
+        results = (prepare_file(*task) for task in tasks)
+    else:
+        results = ordered_map(prepare_file, tasks, workers, initializer=_init_reader, initargs=(text_splitter, clean_fn))
+
+    for filename, (digest, docs) in zip(filenames, results):
+        metadata = {"source": filename}
+        if ingestor.record_source(filename, digest, metadata):
+            print(f"Skipping unchanged file: {filename}")
+            continue
+        print(f"Split {filename} into {len(docs)} chunks")
+        ingestor.add_documents(docs, metadata)
+
+    ingestor.finish()
@@ -0,0 +1,326 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from urllib.parse import urlparse
+
+import aiohttp
+from bs4 import BeautifulSoup
+from lxml import html
+
+# Default number of pages fetched at the same time
+DEFAULT_CONCURRENCY = 8
+
+# Default number of requests per second sent to a single host
+DEFAULT_RATE_LIMIT = 4.0
+
+# Default number of retries for failed requests
+DEFAULT_RETRIES = 3
+
+# HTTP statuses worth retrying; anything else is a permanent failure
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+# Function to clean text and remove the feedback section of the Ruby on Rails guides
+def clean_ror_content(content):
+    # Remove HTML/XML tags
+    content = re.sub(r'<[^>]*>', '', content)
+
+    # Remove the feedback section
+    feedback_text = (
+        r"Feedback\s+You're encouraged to help improve the quality of this guide.\s+"
+        r"Please contribute if you see any typos or factual errors.*?on the official Ruby on Rails Forum\."
+    )
+    content = re.sub(feedback_text, '', content, flags=re.DOTALL)
+
+    return content
+
+
+# Per-site crawl configuration. `sitemap` is a URL or a local file, `content_xpaths` are
+# tried in order and the first one that matches is used as the page content.
+SITES = {
+    "FastAPI": {
+        "sitemap": "https://fastapi.tiangolo.com/sitemap.xml",
+        "output_folder": "FastAPI-Docs",
+        "content_xpaths": ["/html/body/div[3]/main/div/div[3]/article"],
+        "clean": None,
+    },
+    "Flutter": {
+        "sitemap": "https://docs.flutter.dev/sitemap.xml",
+        "output_folder": "Flutter-Docs",
+        "content_xpaths": ["/html/body/div[3]/div/main/div[2]"],
+        "clean": None,
+    },
+    "RubyOnRails": {
+        "sitemap": "ror-sitemap.xml",
+        "output_folder": "RoR-Docs",
+        "content_xpaths": ["/html/body/main/div/div", "/html/body/div[5]/div/div"],
+        "clean": clean_ror_content,
+    },
+}
+
+
+# Command line options shared by all the scraper scripts
+def parse_crawl_args(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"Pages fetched at the same time (default: {DEFAULT_CONCURRENCY})")
+    parser.add_argument("--rate-limit", type=float, default=DEFAULT_RATE_LIMIT,
+                        help=f"Requests per second per host, 0 to disable (default: {DEFAULT_RATE_LIMIT})")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES,
+                        help=f"Retries for failed requests (default: {DEFAULT_RETRIES})")
+    parser.add_argument("--timeout", type=float, default=30.0,
+                        help="Total timeout of a single request in seconds (default: 30)")
+    parser.add_argument("--sitemap", default=None,
+                        help="Sitemap URL or file overriding the site's default, e.g. a local fixture server")
+    parser.add_argument("--output-folder", default=None,
+                        help="Folder the scraped pages are written to, overriding the site's default")
+    parser.add_argument("--full", action="store_true",
+                        help="Ignore the crawl state and download every page again")
+    return parser.parse_args()
+
+
+# Per-site record of the sitemap lastmod, ETag, Last-Modified and content hash of every
+# crawled URL, kept next to the scraped pages so re-crawls only fetch what changed
+class CrawlState:
+    def __init__(self, output_folder):
+        self.path = os.path.join(output_folder, ".crawl-state.json")
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as file:
+                self.entries = json.load(file)
+
+    def get(self, url):
+        entry = self.entries.get(url)
+        # A page whose file has been deleted has to be fetched in full again
+        if entry and not os.path.exists(entry.get("file_path", "")):
+            return {}
+        return entry or {}
+
+    def save(self):
+        # Write to a temporary file first so an interrupted crawl never leaves a torn state file
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self.entries, file, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+# Spaces the requests sent to each host so that no host sees more than `rate` requests/sec
+class HostRateLimiter:
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_slot = {}
+        self.locks = {}
+
+    async def wait(self, host):
+        if not self.interval:
+            return
+        lock = self.locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+# Parse the (page URL, lastmod or None) pairs out of sitemap XML
+def parse_sitemap(sitemap_xml):
+    soup = BeautifulSoup(sitemap_xml, 'xml')
+    pages = []
+    for url in soup.find_all('url'):
+        lastmod = url.find('lastmod')
+        pages.append((url.find('loc').text.strip(), lastmod.text.strip() if lastmod else None))
+    return pages
+
+
+# Get the page title to use as the filename
+def page_filename(tree):
+    page_title = tree.xpath('//title/text()')
+    if page_title:
+        # Clean the title to make it filename-friendly
+        return page_title[0].strip().replace(' ', '_').replace('/', '_').replace('\\', '_')
+    return "untitled_page"
+
+
+# Extract the configured content of a page. Returns the (file path, file content) to write,
+# or None when no XPath matched.
+def extract_page(site, output_folder, page_url, content):
+    # Parse the page content with lxml and HTML parser
+    tree = html.fromstring(content)
+
+    # Use the site's XPaths to target the article content
+    for xpath in site["content_xpaths"]:
+        article_content = tree.xpath(xpath)
+        if article_content:
+            break
+    else:
+        return None
+
+    # Extract the text from the article section
+    content_text = article_content[0].text_content()
+    if site["clean"]:
+        content_text = site["clean"](content_text)
+
+    file_path = os.path.join(output_folder, f"{page_filename(tree)}.txt")
+    return file_path, f"### Content from {page_url} ###\n{content_text}"
+
+
+# Create a file for each page
+def write_page(file_path, file_content):
+    with open(file_path, 'w', encoding='utf-8') as file:
+        file.write(file_content)
+
+
+# Async crawler sharing one pooled keep-alive session across all requests, with a global
+# concurrency limit, per-host rate limiting and retries with exponential backoff
+class Crawler:
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, rate_limit=DEFAULT_RATE_LIMIT,
+                 retries=DEFAULT_RETRIES, timeout=30.0):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        self.concurrency = concurrency
+        self.retries = retries
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.rate_limiter = HostRateLimiter(rate_limit)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=30)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def fetch(self, url, headers=None):
+        # Returns (status, body, response headers); body is None for non-200 responses
+        host = urlparse(url).netloc
+        for attempt in range(self.retries + 1):
+            await self.rate_limiter.wait(host)
+            try:
+                async with self.semaphore, self.session.get(url, headers=headers) as response:
+                    if response.status == 200:
+                        return response.status, await response.read(), response.headers
+                    if response.status not in RETRY_STATUSES or attempt == self.retries:
+                        return response.status, None, response.headers
+                    retry_after = response.headers.get("Retry-After")
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == self.retries:
+                    raise
+                retry_after = None
+
+            # Back off exponentially with jitter, honouring Retry-After when the server sends one
+            delay = 0.5 * (2 ** attempt) + random.uniform(0, 0.5)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            await asyncio.sleep(delay)
+
+    async def fetch_sitemap(self, sitemap):
+        if sitemap.startswith(("http://", "https://")):
+            status, body, _ = await self.fetch(sitemap)
+            if body is None:
+                raise RuntimeError(f"Failed to fetch the sitemap {sitemap} (status {status})")
+            return body
+        with open(sitemap, "r") as f:
+            return f.read()
+
+
+# Crawl the pages of a site's sitemap and write the extracted content to its output folder.
+# Unless `full` is set, pages whose sitemap lastmod is unchanged are not requested at all,
+# the rest are fetched with conditional GETs, and only pages whose content changed are rewritten.
+async def crawl_site(site, concurrency=DEFAULT_CONCURRENCY, rate_limit=DEFAULT_RATE_LIMIT,
+                     retries=DEFAULT_RETRIES, timeout=30.0, sitemap=None, output_folder=None, full=False):
+    output_folder = output_folder or site["output_folder"]
+    os.makedirs(output_folder, exist_ok=True)
+    state = CrawlState(output_folder)
+    stats = {"saved": 0, "unchanged": 0, "skipped": 0, "empty": 0, "failed": 0}
+    started_at = time.perf_counter()
+
+    async with Crawler(concurrency, rate_limit, retries, timeout) as crawler:
+        pages = parse_sitemap(await crawler.fetch_sitemap(sitemap or site["sitemap"]))
+        print(f"Scraping {len(pages)} pages with concurrency {concurrency}...")
+
+        async def scrape(page_url, lastmod):
+            previous = {} if full else state.get(page_url)
+            if lastmod and previous.get("lastmod") == lastmod:
+                stats["skipped"] += 1
+                return
+
+            # Conditional GET: the server answers 304 when the page has not changed
+            headers = {}
+            if previous.get("etag"):
+                headers["If-None-Match"] = previous["etag"]
+            if previous.get("last_modified"):
+                headers["If-Modified-Since"] = previous["last_modified"]
+
+            try:
+                status, content, response_headers = await crawler.fetch(page_url, headers=headers)
+                if status == 304:
+                    state.entries[page_url] = {**previous, "lastmod": lastmod}
+                    stats["unchanged"] += 1
+                    return
+                if content is None:
+                    print(f"Failed to retrieve {page_url} (status {status})")
+                    stats["failed"] += 1
+                    return
+
+                # Parse off the event loop so other downloads keep flowing
+                page = await asyncio.to_thread(extract_page, site, output_folder, page_url, content)
+                if page is None:
+                    print(f"No content found at specified XPath in {page_url}")
+                    stats["empty"] += 1
+                    return
+
+                file_path, file_content = page
+                content_hash = hashlib.sha256(file_content.encode("utf-8")).hexdigest()
+                if content_hash == previous.get("content_hash") and file_path == previous.get("file_path"):
+                    stats["unchanged"] += 1
+                else:
+                    await asyncio.to_thread(write_page, file_path, file_content)
+                    print(f"Successfully scraped {page_url} and saved as {file_path}")
+                    stats["saved"] += 1
+
+                state.entries[page_url] = {
+                    "lastmod": lastmod,
+                    "etag": response_headers.get("ETag"),
+                    "last_modified": response_headers.get("Last-Modified"),
+                    "content_hash": content_hash,
+                    "file_path": file_path,
+                }
+            except Exception as e:
+                print(f"Error occurred while scraping {page_url}: {e}")
+                stats["failed"] += 1
+
+        try:
+            await asyncio.gather(*(scrape(page_url, lastmod) for page_url, lastmod in pages))
+        finally:
+            state.save()
+
+    elapsed = time.perf_counter() - started_at
+    print(
+        f"Scraped {len(pages)} pages in {elapsed:.2f}s ({len(pages) / max(elapsed, 1e-9):.1f} pages/sec): "
+        f"{stats['saved']} saved, {stats['unchanged']} unchanged, {stats['skipped']} skipped by lastmod, "
+        f"{stats['empty']} without content, {stats['failed']} failed"
+    )
+    return stats
+
+
+# Entry point used by the per-site scraper scripts
+def run_site(site_name, description):
+    args = parse_crawl_args(description)
+    asyncio.run(crawl_site(
+        SITES[site_name],
+        concurrency=args.concurrency,
+        rate_limit=args.rate_limit,
+        retries=args.retries,
+        timeout=args.timeout,
+        sitemap=args.sitemap,
+        output_folder=args.output_folder,
+        full=args.full,
+    ))